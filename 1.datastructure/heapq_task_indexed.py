@@ -0,0 +1,177 @@
+'''
+heapq_task.py updates a priority by marking the old entry as REMOVED
+and pushing a new one, so the heap slowly fills up with dead entries.
+An indexed heap remembers where every task sits in the heap, which
+lets update_priority, remove and pop move the entry in place. The heap
+never holds more entries than there are live tasks.
+'''
+# before anything that imports heapq, see stdlib_heapq
+import stdlib_heapq  # noqa: F401
+
+import itertools
+
+
+class IndexedHeap:
+    def __init__(self):
+        self._heap = []                 # list of [priority, count, task]
+        self._position = {}             # mapping of tasks to heap index
+        self._counter = itertools.count()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def __contains__(self, task):
+        return task in self._position
+
+    def add_task(self, task, priority=0):
+        '''Add a new task or update the priority of an existing task'''
+        if task in self._position:
+            self.update_priority(task, priority)
+            return
+        entry = [priority, next(self._counter), task]
+        self._heap.append(entry)
+        self._position[task] = len(self._heap) - 1
+        self._siftdown(0, len(self._heap) - 1)
+
+    def update_priority(self, task, priority):
+        '''Change the priority of a task. Raise KeyError if not found.'''
+        pos = self._position[task]
+        entry = self._heap[pos]
+        old_priority = entry[0]
+        # A fresh count keeps the behaviour of heapq_task.add_task, where
+        # an updated task goes behind the tasks it ties with
+        entry[0] = priority
+        entry[1] = next(self._counter)
+        if priority < old_priority:
+            self._siftdown(0, pos)
+        else:
+            self._siftup(pos)
+
+    def remove(self, task):
+        '''Remove a task. Raise KeyError if not found.'''
+        pos = self._position.pop(task)
+        last = self._heap.pop()
+        if pos < len(self._heap):
+            self._heap[pos] = last
+            self._position[last[-1]] = pos
+            self._siftdown(0, pos)
+            self._siftup(self._position[last[-1]])
+
+    def pop(self):
+        '''Remove and return the lowest priority task. Raise KeyError if empty.'''
+        if not self._heap:
+            raise KeyError('pop from an empty priority queue')
+        last = self._heap.pop()
+        if not self._heap:
+            del self._position[last[-1]]
+            return last[-1]
+        top = self._heap[0]
+        self._heap[0] = last
+        self._position[last[-1]] = 0
+        self._siftup(0)
+        del self._position[top[-1]]
+        return top[-1]
+
+    def peek(self):
+        '''Return the lowest priority task without removing it.'''
+        if not self._heap:
+            raise KeyError('peek at an empty priority queue')
+        return self._heap[0][-1]
+
+    # Same API as the module level functions of heapq_task
+    remove_task = remove
+    pop_task = pop
+
+    # The two helpers below follow heapq._siftdown/_siftup, with the
+    # difference that every move is recorded in self._position
+    def _siftdown(self, startpos, pos):
+        heap = self._heap
+        position = self._position
+        newitem = heap[pos]
+        while pos > startpos:
+            parentpos = (pos - 1) >> 1
+            parent = heap[parentpos]
+            if newitem < parent:
+                heap[pos] = parent
+                position[parent[-1]] = pos
+                pos = parentpos
+                continue
+            break
+        heap[pos] = newitem
+        position[newitem[-1]] = pos
+
+    def _siftup(self, pos):
+        heap = self._heap
+        position = self._position
+        endpos = len(heap)
+        newitem = heap[pos]
+        childpos = 2 * pos + 1
+        while childpos < endpos:
+            rightpos = childpos + 1
+            if rightpos < endpos and not heap[childpos] < heap[rightpos]:
+                childpos = rightpos
+            child = heap[childpos]
+            if not child < newitem:
+                break
+            heap[pos] = child
+            position[child[-1]] = pos
+            pos = childpos
+            childpos = 2 * pos + 1
+        heap[pos] = newitem
+        position[newitem[-1]] = pos
+
+
+def benchmark(ntasks=1000, nupdates=200000, seed=0):
+    '''
+    Update heavy workload: a fixed set of tasks gets its priorities
+    changed over and over, then every task is popped
+    '''
+    import random
+    import time
+    import heapq_task
+
+    rnd = random.Random(seed)
+    updates = [(rnd.randrange(ntasks), rnd.random()) for _ in range(nupdates)]
+
+    heapq_task.pq.clear()
+    heapq_task.entry_finder.clear()
+    start = time.perf_counter()
+    for task in range(ntasks):
+        heapq_task.add_task(task, 0)
+    for task, priority in updates:
+        heapq_task.add_task(task, priority)
+    peak = len(heapq_task.pq)
+    for _ in range(ntasks):
+        heapq_task.pop_task()
+    tombstone = time.perf_counter() - start
+
+    heap = IndexedHeap()
+    start = time.perf_counter()
+    for task in range(ntasks):
+        heap.add_task(task, 0)
+    for task, priority in updates:
+        heap.add_task(task, priority)
+    for _ in range(ntasks):
+        heap.pop_task()
+    indexed = time.perf_counter() - start
+
+    print('{} tasks, {} updates'.format(ntasks, nupdates))
+    print('tombstone heap: {:.3f}s, {} entries at peak'.format(tombstone, peak))
+    print('indexed heap:   {:.3f}s, {} entries at peak'.format(indexed, ntasks))
+
+
+if __name__ == '__main__':
+    heap = IndexedHeap()
+    heap.add_task('write code', 5)
+    heap.add_task('release product', 7)
+    heap.add_task('write spec', 1)
+    heap.add_task('create tests', 3)
+    heap.add_task('release product', 2)
+    heap.remove_task('create tests')
+    while heap:
+        print(heap.pop_task())
+    # >> write spec
+    # >> release product
+    # >> write code
+    print('-x-'*30)
+    benchmark()
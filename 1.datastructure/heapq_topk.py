@@ -0,0 +1,245 @@
+'''
+heapq.py picks the most expensive shares with heapq.nlargest on a
+portfolio that is already in memory. TopK keeps only the k best records
+seen so far, so memory stays bounded no matter how
+many records are fed to it. Records can be added one at a time or in
+chunks, and partial results built in separate processes merge into the
+global answer.
+'''
+# before anything that imports heapq, see stdlib_heapq
+import stdlib_heapq  # noqa: F401
+
+import csv
+import heapq
+import itertools
+import operator
+import time
+from concurrent.futures import ProcessPoolExecutor
+from operator import itemgetter
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+class TopK:
+    def __init__(self, k, key=None, largest=True):
+        self.k = k
+        self.key = key
+        self.largest = largest
+        self._select = heapq.nlargest if largest else heapq.nsmallest
+        # a record gets in when better(threshold, its key) is true
+        self._better = operator.lt if largest else operator.gt
+        # the k best records seen so far, best first, and their keys. For
+        # equal keys the record seen first comes first, as in nlargest
+        self._best = []
+        self._values = []
+        # records given to add() and not yet merged into _best
+        self._pending = []
+
+    def __len__(self):
+        self._flush()
+        return len(self._best)
+
+    def add(self, record):
+        pending = self._pending
+        pending.append(record)
+        # merged a batch at a time, so memory stays within 2k (or k + 1024)
+        if len(pending) >= max(self.k, 1024):
+            self._flush()
+
+    def _flush(self):
+        if self._pending:
+            pending, self._pending = self._pending, []
+            self._extend_records(pending)
+
+    def extend(self, records):
+        '''Add a chunk of records'''
+        self._flush()
+        self._extend_records(records)
+
+    def _extend_records(self, records):
+        if not isinstance(records, (list, tuple)):
+            # a stream is read a batch at a time, memory stays bounded
+            records = iter(records)
+            size = max(self.k, 10000)
+            batch = list(itertools.islice(records, size))
+            while batch:
+                self._extend_records(batch)
+                batch = list(itertools.islice(records, size))
+            return
+        key = self.key
+        if len(records) >= 16 * self.k > 0:
+            # With k small next to the chunk, one nlargest (or nsmallest)
+            # call over the best so far and the chunk: the best go first,
+            # so they win ties against later records, and once they are
+            # read its threshold is the current k-th best, so most of the
+            # chunk is skipped on one comparison
+            best = self._select(self.k, itertools.chain(self._best, records),
+                                key=key)
+            self._best = best
+            self._values = best if key is None else list(map(key, best))
+            return
+        self._extend(records if key is None else list(map(key, records)),
+                     records)
+
+    def extend_array(self, keys, records=None):
+        '''
+        Add a chunk of numeric keys, with records[i] belonging to keys[i]
+        (by default the keys are the records). When NumPy is installed
+        only the k candidates found by argpartition are merged
+        '''
+        self._flush()
+        if records is None:
+            records = keys
+        if np is not None:
+            indices = topk_indices(keys, self.k, self.largest).tolist()
+            keys = np.asarray(keys)[indices].tolist()
+            records = [records[i] for i in indices]
+        self._extend(keys, records)
+
+    def _extend(self, values, records):
+        k = self.k
+        if k <= 0:
+            return
+        if len(self._best) >= k:
+            # Only a record better than the current k-th best can get in.
+            # Its key is compared to it by map and picked by compress, in
+            # C; nothing else is done for the records that don't pass
+            passed = map(self._better, itertools.repeat(self._values[-1]),
+                         values)
+            chosen = list(itertools.compress(range(len(values)), passed))
+            if not chosen:
+                return
+            values = map(values.__getitem__, chosen)
+            records = map(records.__getitem__, chosen)
+        values = self._values + list(values)
+        records = self._best + list(records)
+        # The best so far and the new records are ordered by one sorted()
+        # call on their positions, which allocates no tuples. It is
+        # stable, so the best so far win ties against later records, and
+        # on the two runs it mostly merges
+        order = sorted(range(len(values)), key=values.__getitem__,
+                       reverse=self.largest)[:k]
+        self._values = list(map(values.__getitem__, order))
+        self._best = list(map(records.__getitem__, order))
+
+    def merge(self, other):
+        '''Fold the result of another TopK (e.g. from another process) in'''
+        self.extend(other.result())
+        return self
+
+    @classmethod
+    def merged(cls, partials):
+        partials = list(partials)
+        first = partials[0]
+        total = cls(first.k, first.key, first.largest)
+        for partial in partials:
+            total.merge(partial)
+        return total
+
+    def result(self):
+        '''Return the records, best first'''
+        self._flush()
+        return list(self._best)
+
+
+def topk_indices(values, k, largest=True):
+    '''
+    Vectorized top-k for a NumPy array of numbers, returns the indices
+    of the k largest (or smallest) values best first
+    '''
+    values = np.asarray(values)
+    k = min(k, len(values))
+    if k == 0:
+        return np.empty(0, dtype=np.intp)
+    order = -values if largest else values
+    if k < len(values):
+        candidates = np.argpartition(order, k - 1)[:k]
+    else:
+        candidates = np.arange(len(values))
+    # a stable sort keeps the first seen record first among equal values
+    return candidates[np.argsort(order[candidates], kind='stable')]
+
+
+def read_portfolio(path):
+    '''Yield portfolio records from a csv file with name,shares,price'''
+    with open(path, newline='') as f:
+        for row in csv.DictReader(f):
+            yield {'name': row['name'],
+                   'shares': int(row['shares']),
+                   'price': float(row['price'])}
+
+
+def _topk_file(path, k, field, largest):
+    topk = TopK(k, key=itemgetter(field), largest=largest)
+    topk.extend(read_portfolio(path))
+    return topk
+
+
+def topk_from_files(paths, k, field='price', largest=True, workers=None):
+    '''Top-k over many portfolio files, one process per file'''
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        partials = pool.map(_topk_file, paths, itertools.repeat(k),
+                            itertools.repeat(field), itertools.repeat(largest))
+        total = TopK(k, key=itemgetter(field), largest=largest)
+        for partial in partials:
+            total.merge(partial)
+    return total.result()
+
+
+def benchmark(n=1000000, ratios=(0.00001, 0.001, 0.01, 0.1)):
+    import random
+
+    key = itemgetter('price')
+    prices = [random.random() * 1000 for _ in range(n)]
+    records = [{'name': 'S%d' % i, 'shares': 1, 'price': p}
+               for i, p in enumerate(prices)]
+    print('{:>8} {:>10} {:>10} {:>10}'.format(
+        'k', 'nlargest', 'TopK', 'numpy'))
+    for ratio in ratios:
+        k = max(1, int(n * ratio))
+        start = time.perf_counter()
+        expected = heapq.nlargest(k, records, key=key)
+        t_nlargest = time.perf_counter() - start
+
+        start = time.perf_counter()
+        topk = TopK(k, key=key)
+        for i in range(0, n, 100000):
+            topk.extend(records[i:i + 100000])
+        assert topk.result() == expected
+        t_topk = time.perf_counter() - start
+
+        t_numpy = 'n/a'
+        if np is not None:
+            array = np.array(prices)
+            start = time.perf_counter()
+            indices = topk_indices(array, k)
+            t_numpy = '{:.3f}s'.format(time.perf_counter() - start)
+            assert [records[i] for i in indices] == expected
+        print('{:>8} {:>9.3f}s {:>9.3f}s {:>10}'.format(
+            k, t_nlargest, t_topk, t_numpy))
+
+
+if __name__ == '__main__':
+    portfolio = [{'name': 'IBM', 'shares': 100, 'price': 91.1},
+                 {'name': 'AAPL', 'shares': 50, 'price': 543.22},
+                 {'name': 'FB', 'shares': 200, 'price': 21.09},
+                 {'name': 'HPQ', 'shares': 35, 'price': 31.75},
+                 {'name': 'YHOO', 'shares': 45, 'price': 16.35},
+                 {'name': 'ACME', 'shares': 75, 'price': 115.65}]
+
+    first, second = TopK(2, key=itemgetter('price')), TopK(2, key=itemgetter('price'))
+    for s in portfolio[:3]:
+        first.add(s)
+    second.extend(portfolio[3:])
+    print(TopK.merged([first, second]).result())
+    # >> [{'name': 'AAPL', ...}, {'name': 'ACME', ...}]
+
+    cheapest = TopK(2, key=itemgetter('price'), largest=False)
+    cheapest.extend(portfolio)
+    print(cheapest.result())
+    # >> [{'name': 'YHOO', ...}, {'name': 'FB', ...}]
+    print('-x-'*30)
+    benchmark()
@@ -0,0 +1,159 @@
+'''
+map(Employee._make, rows) keeps one tuple per row plus one str per
+field, and age stays a string with a leading space. EmployeeColumns
+reads the csv in blocks of rows and stores every field as a typed
+column instead:
+
+- name: a list of str
+- age: an array of machine ints
+- title, department: dictionary encoded, each distinct value is kept
+  once and rows store a small integer code
+
+An Employee namedtuple is only built when a row is accessed.
+'''
+import csv
+from array import array
+from itertools import islice
+from operator import itemgetter
+
+from namedtuple_employee import Employee
+
+_NAME, _AGE, _TITLE, _DEPARTMENT = map(itemgetter, range(4))
+
+
+class DictionaryColumn:
+    '''A column of repeated strings stored as codes into a list of values'''
+
+    def __init__(self, typecode='H'):
+        self.values = []
+        self.codes = array(typecode)
+        self._code_of = {}
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        return self.values[self.codes[index]]
+
+    def __iter__(self):
+        values = self.values
+        return (values[code] for code in self.codes)
+
+    def extend(self, strings):
+        code_of = self._code_of
+        values = self.values
+        # Only the distinct values of the block go through a Python loop,
+        # every row is then encoded by a dict lookup done in C
+        for s in dict.fromkeys(strings):
+            if s not in code_of:
+                code_of[s] = len(values)
+                values.append(s)
+        if len(values) > 1 << (8 * self.codes.itemsize):
+            # more distinct values than the current codes can hold
+            self.codes = array('I', self.codes)
+        self.codes.extend(map(code_of.__getitem__, strings))
+
+    def code(self, value):
+        '''Return the code of value, or None if it never occurs'''
+        return self._code_of.get(value)
+
+
+class EmployeeColumns:
+    def __init__(self):
+        self.name = []
+        self.age = array('l')
+        self.title = DictionaryColumn()
+        self.department = DictionaryColumn()
+
+    @classmethod
+    def load(cls, path, block_rows=1024, header=True):
+        table = cls()
+        with open(path, newline='') as f:
+            rows = csv.reader(f, skipinitialspace=True)
+            if header:
+                next(rows, None)
+            # Small blocks are faster than large ones: the row lists die
+            # young and never reach the older gc generations
+            while True:
+                block = list(islice(rows, block_rows))
+                if not block:
+                    break
+                table.extend(block)
+        return table
+
+    def extend(self, rows):
+        '''Append a block of (name, age, title, department) rows'''
+        # Each column is pulled out of the block with an itemgetter in C,
+        # the row lists only live as long as the block does
+        self.name.extend(map(_NAME, rows))
+        self.age.extend(map(int, map(_AGE, rows)))
+        self.title.extend(list(map(_TITLE, rows)))
+        self.department.extend(list(map(_DEPARTMENT, rows)))
+
+    def __len__(self):
+        return len(self.age)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        return Employee(self.name[index], self.age[index],
+                        self.title[index], self.department[index])
+
+    def __iter__(self):
+        return map(Employee, self.name, self.age,
+                   self.title, self.department)
+
+
+def benchmark(nrows=1000000):
+    import os
+    import random
+    import tempfile
+    import time
+    import tracemalloc
+
+    fd, path = tempfile.mkstemp(suffix='.csv')
+    try:
+        titles = ['PM', 'BA', 'DV', 'QA', 'SE', 'HR']
+        departments = ['IT', 'BI', 'HR', 'FIN']
+        with open(fd, 'w', newline='') as f:
+            f.write('name, age, title, department\n')
+            for i in range(nrows):
+                f.write('Emp{}, {}, {}, {}\n'.format(
+                    i, random.randint(20, 60), random.choice(titles),
+                    random.choice(departments)))
+
+        def namedtuples():
+            with open(path, newline='') as f:
+                rows = csv.reader(f)
+                next(rows)
+                return list(map(Employee._make, rows))
+
+        def columns():
+            return EmployeeColumns.load(path)
+
+        for label, load in (('map(Employee._make)', namedtuples),
+                            ('EmployeeColumns', columns)):
+            start = time.perf_counter()
+            result = load()
+            elapsed = time.perf_counter() - start
+            del result
+            tracemalloc.start()
+            result = load()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            del result
+            print('{:>20}: {} rows, {:.3f}s, {:.1f} MB held, '
+                  '{:.1f} MB peak'.format(
+                      label, nrows, elapsed, current / 2**20, peak / 2**20))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    employees = EmployeeColumns.load('employees.csv')
+    for emp in employees:
+        print(emp)
+        print(emp.name, emp.age)
+    print(employees[1])
+    print('-x-'*30)
+    benchmark()
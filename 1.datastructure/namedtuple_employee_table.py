@@ -0,0 +1,205 @@
+'''
+Reports like "employees in IT" or "average age per title" over the
+Employee records of namedtuple_employee.py need a full scan each time.
+EmployeeTable keeps secondary hash indexes on chosen columns, mapping
+each value to the ids of the rows that have it. Every index bucket also
+keeps a running count, sum, min and max of the numeric measure columns.
+Both are updated on insert, so
+
+- where(department='IT') is a dict lookup
+- group_by('title', 'mean', 'age') reads one summary per title and
+  does not look at the rows at all
+'''
+import csv
+from operator import attrgetter
+
+from namedtuple_employee import Employee
+
+AGGREGATES = ('count', 'sum', 'mean', 'min', 'max')
+_REDUCERS = {'count': len, 'sum': sum, 'min': min, 'max': max,
+             'mean': lambda values: sum(values) / len(values)}
+
+
+class _Bucket:
+    __slots__ = ('rowids', 'stats')
+
+    def __init__(self, measures):
+        self.rowids = []
+        # measure -> [sum, min, max]
+        self.stats = {measure: [0, None, None] for measure in measures}
+
+    def add(self, rowid, row):
+        self.rowids.append(rowid)
+        for measure, stat in self.stats.items():
+            value = getattr(row, measure)
+            stat[0] += value
+            if stat[1] is None or value < stat[1]:
+                stat[1] = value
+            if stat[2] is None or value > stat[2]:
+                stat[2] = value
+
+    def aggregate(self, aggregate, measure):
+        count = len(self.rowids)
+        if aggregate == 'count':
+            return count
+        total, low, high = self.stats[measure]
+        if aggregate == 'sum':
+            return total
+        if aggregate == 'mean':
+            return total / count
+        return low if aggregate == 'min' else high
+
+
+class EmployeeTable:
+    def __init__(self, indexes=('department', 'title'), measures=('age',),
+                 record_type=Employee):
+        self.record_type = record_type
+        self.rows = []
+        self.measures = tuple(measures)
+        self._indexes = {}
+        for field in indexes:
+            self.create_index(field)
+
+    @classmethod
+    def load(cls, path, **kwargs):
+        '''Load a csv with a header line, converting age to int'''
+        table = cls(**kwargs)
+        with open(path, newline='') as f:
+            rows = csv.reader(f, skipinitialspace=True)
+            next(rows, None)
+            table.extend(Employee(name, int(age), title, department)
+                         for name, age, title, department in rows)
+        return table
+
+    def create_index(self, field):
+        if field not in self.record_type._fields:
+            raise ValueError('Unknown field: %r' % field)
+        index = self._indexes[field] = {}
+        key = attrgetter(field)
+        for rowid, row in enumerate(self.rows):
+            self._add_to_index(index, key(row), rowid, row)
+
+    def _add_to_index(self, index, value, rowid, row):
+        bucket = index.get(value)
+        if bucket is None:
+            bucket = index[value] = _Bucket(self.measures)
+        bucket.add(rowid, row)
+
+    def insert(self, row):
+        rowid = len(self.rows)
+        self.rows.append(row)
+        for field, index in self._indexes.items():
+            self._add_to_index(index, getattr(row, field), rowid, row)
+        return rowid
+
+    def extend(self, rows):
+        for row in rows:
+            self.insert(row)
+
+    def __len__(self):
+        return len(self.rows)
+
+    def _rowids(self, conditions):
+        '''Return the ids matching conditions, or None for "all rows"'''
+        indexed = [(field, value) for field, value in conditions.items()
+                   if field in self._indexes]
+        if not indexed:
+            return None
+        buckets = []
+        for field, value in indexed:
+            bucket = self._indexes[field].get(value)
+            if bucket is None:
+                return []
+            buckets.append(bucket.rowids)
+        # Start from the smallest bucket and intersect with the others
+        buckets.sort(key=len)
+        rowids = buckets[0]
+        for other in buckets[1:]:
+            other = set(other)
+            rowids = [rowid for rowid in rowids if rowid in other]
+        return rowids
+
+    def where(self, **conditions):
+        '''Return the rows whose fields equal the given values'''
+        for field in conditions:
+            if field not in self.record_type._fields:
+                raise ValueError('Unknown field: %r' % field)
+        rowids = self._rowids(conditions)
+        # a new list either way, changing it leaves the table alone
+        rows = list(self.rows) if rowids is None else [self.rows[i] for i in rowids]
+        rest = [(attrgetter(field), value) for field, value in conditions.items()
+                if field not in self._indexes]
+        if rest:
+            rows = [row for row in rows
+                    if all(key(row) == value for key, value in rest)]
+        return rows
+
+    def count(self, **conditions):
+        if len(conditions) == 1:
+            (field, value), = conditions.items()
+            if field in self._indexes:
+                bucket = self._indexes[field].get(value)
+                return 0 if bucket is None else len(bucket.rowids)
+        return len(self.where(**conditions))
+
+    def group_by(self, field, aggregate='count', measure=None, **conditions):
+        '''
+        Return {value of field: aggregate of measure} where aggregate is
+        one of count, sum, mean, min or max. Grouping an indexed field by
+        a measure column without conditions only reads the bucket summaries
+        '''
+        if aggregate not in AGGREGATES:
+            raise ValueError('aggregate must be one of %s' % ', '.join(AGGREGATES))
+        if aggregate != 'count' and measure is None:
+            raise ValueError('%s needs a measure column' % aggregate)
+        index = self._indexes.get(field)
+        if index is not None and not conditions and (
+                aggregate == 'count' or measure in self.measures):
+            return {value: bucket.aggregate(aggregate, measure)
+                    for value, bucket in index.items()}
+
+        groups = {}
+        key = attrgetter(field)
+        for row in self.where(**conditions):
+            groups.setdefault(key(row), []).append(row)
+        reduce = _REDUCERS[aggregate]
+        if aggregate == 'count':
+            return {value: reduce(rows) for value, rows in groups.items()}
+        key = attrgetter(measure)
+        return {value: reduce(list(map(key, rows)))
+                for value, rows in groups.items()}
+
+
+if __name__ == '__main__':
+    table = EmployeeTable.load('employees.csv')
+    print(table.where(department='IT'))
+    # >> [Employee(name='Aman', age=22, ...), Employee(name='Rahul', age=20, ...)]
+    print(table.count(department='IT'))
+    # >> 2
+    print(table.group_by('department', 'mean', 'age'))
+    # >> {'IT': 21.0, 'BI': 21.0}
+    print(table.group_by('title'))
+    # >> {'PM': 1, 'BA': 1, 'DV': 1}
+    print(table.group_by('department', 'max', 'age', title='PM'))
+    # >> {'IT': 22}
+
+    import random
+    import time
+    big = EmployeeTable()
+    big.extend(Employee('Emp%d' % i, random.randint(20, 60),
+                        random.choice(['PM', 'BA', 'DV', 'QA']),
+                        random.choice(['IT', 'BI', 'HR']))
+               for i in range(200000))
+    start = time.perf_counter()
+    for _ in range(100):
+        by_index = big.group_by('title', 'mean', 'age')
+    indexed = time.perf_counter() - start
+    start = time.perf_counter()
+    for _ in range(100):
+        groups = {}
+        for emp in big.rows:
+            groups.setdefault(emp.title, []).append(emp.age)
+        by_scan = {title: sum(ages) / len(ages) for title, ages in groups.items()}
+    scanned = time.perf_counter() - start
+    print('100 reports: {:.4f}s from the index, {:.3f}s scanning'.format(
+        indexed, scanned))
@@ -0,0 +1,199 @@
+'''
+A million Point instances are a million tuples holding two million
+float objects. PointArray keeps the x and y coordinates in two flat
+buffers of doubles and works on all points at once. Indexing returns a
+Point, built only at that moment. Slices are views on the same buffers.
+
+NumPy is used when it is installed. Without it the columns are
+memoryviews over array('d') and the operations run through map and
+the math module.
+'''
+# before anything that imports heapq, see stdlib_heapq
+import stdlib_heapq  # noqa: F401
+
+import heapq
+import math
+from array import array
+from itertools import chain, repeat
+from operator import add, sub
+
+from namedtuple_point import Point
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _column(values):
+    '''
+    Return values as a 1-d column of doubles, without copying if possible.
+    A memoryview of doubles may be strided, raw bytes must be contiguous
+    '''
+    if np is not None:
+        if isinstance(values, memoryview) and values.format == 'd':
+            # np.frombuffer raises BufferError for a strided view
+            return np.asarray(values)
+        if isinstance(values, (bytes, bytearray, memoryview)):
+            return np.frombuffer(values, dtype=np.float64)
+        return np.asarray(values, dtype=np.float64)
+    if isinstance(values, (bytes, bytearray)):
+        return memoryview(values).cast('d')
+    if isinstance(values, memoryview):
+        return values if values.format == 'd' else values.cast('B').cast('d')
+    if isinstance(values, array) and values.typecode == 'd':
+        return memoryview(values)
+    return memoryview(array('d', values))
+
+
+class PointArray:
+    __slots__ = ('x', 'y')
+
+    _fields = Point._fields
+
+    def __init__(self, x=(), y=()):
+        self.x = _column(x)
+        self.y = _column(y)
+        if len(self.x) != len(self.y):
+            raise ValueError('x and y must have the same length')
+
+    @classmethod
+    def frombuffer(cls, buffer):
+        '''
+        Build from interleaved doubles x0, y0, x1, y1, ... The columns are
+        strided views on buffer, nothing is copied. buffer may be a strided
+        memoryview of doubles, any other buffer must be contiguous
+        '''
+        if isinstance(buffer, memoryview) and buffer.format == 'd':
+            flat = np.asarray(buffer) if np is not None else buffer
+        elif np is not None:
+            flat = np.frombuffer(buffer, dtype=np.float64)
+        else:
+            flat = memoryview(buffer).cast('B').cast('d')
+        if len(flat) % 2:
+            raise ValueError('buffer holds an odd number of doubles')
+        self = cls.__new__(cls)
+        self.x = flat[0::2]
+        self.y = flat[1::2]
+        return self
+
+    @classmethod
+    def _make(cls, iterable):
+        'Make a new PointArray from an iterable of (x, y) pairs'
+        flat = chain.from_iterable(iterable)
+        if np is not None:
+            return cls.frombuffer(np.fromiter(flat, dtype=np.float64))
+        return cls.frombuffer(array('d', flat))
+
+    def _replace(self, **kwds):
+        'Return a new PointArray replacing whole columns with new values'
+        result = PointArray(kwds.pop('x', self.x), kwds.pop('y', self.y))
+        if kwds:
+            raise ValueError('Got unexpected field names: %r' % list(kwds))
+        return result
+
+    def _asdict(self):
+        'Return a dict which maps field names to their columns.'
+        return {'x': self.x, 'y': self.y}
+
+    def __len__(self):
+        return len(self.x)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            view = PointArray.__new__(PointArray)
+            view.x = self.x[index]
+            view.y = self.y[index]
+            return view
+        return Point(float(self.x[index]), float(self.y[index]))
+
+    def __iter__(self):
+        if np is not None:
+            return map(Point, self.x.tolist(), self.y.tolist())
+        return map(Point, self.x, self.y)
+
+    def __repr__(self):
+        return '{}({} points)'.format(self.__class__.__name__, len(self))
+
+    def take(self, indices):
+        'Return a new PointArray with the points at the given indices'
+        if np is not None:
+            indices = np.asarray(indices, dtype=np.intp)
+            return PointArray(self.x[indices], self.y[indices])
+        x, y = self.x, self.y
+        return PointArray(array('d', (x[i] for i in indices)),
+                          array('d', (y[i] for i in indices)))
+
+    def translate(self, dx, dy):
+        if np is not None:
+            return PointArray(self.x + dx, self.y + dy)
+        return PointArray(array('d', map(add, self.x, repeat(dx))),
+                          array('d', map(add, self.y, repeat(dy))))
+
+    def distance_to(self, point):
+        'Return the distance of every point to point'
+        px, py = point
+        if np is not None:
+            return np.hypot(self.x - px, self.y - py)
+        return array('d', map(math.hypot,
+                              map(sub, self.x, repeat(px)),
+                              map(sub, self.y, repeat(py))))
+
+    def bounding_box(self):
+        'Return the (lower left, upper right) corners as Points'
+        if not len(self):
+            raise ValueError('bounding box of an empty PointArray')
+        x, y = self.x, self.y
+        if np is not None:
+            return (Point(float(x.min()), float(y.min())),
+                    Point(float(x.max()), float(y.max())))
+        return (Point(float(min(x)), float(min(y))),
+                Point(float(max(x)), float(max(y))))
+
+    def nearest_indices(self, point, k):
+        'Return the indices of the k points closest to point, closest first'
+        distances = self.distance_to(point)
+        k = min(k, len(self))
+        if np is not None:
+            if k < len(self):
+                candidates = np.argpartition(distances, k - 1)[:k]
+            else:
+                candidates = np.arange(len(self))
+            return candidates[np.argsort(distances[candidates], kind='stable')]
+        return heapq.nsmallest(k, range(len(self)), key=distances.__getitem__)
+
+    def nearest(self, point, k):
+        return self.take(self.nearest_indices(point, k))
+
+
+if __name__ == '__main__':
+    import random
+    import tracemalloc
+
+    points = PointArray._make([(1, 2), (3, 4), (-1, 5), (0, 0)])
+    print(points[1])
+    # >> Point(x=3.0, y=4.0)
+    print(list(points.translate(1, 1)))
+    print(points.bounding_box())
+    # >> (Point(x=-1.0, y=0.0), Point(x=3.0, y=5.0))
+    print(list(points.nearest(Point(0, 1), 2)))
+    # >> [Point(x=0.0, y=0.0), Point(x=1.0, y=2.0)]
+    print(points[1:3]._asdict())
+
+    raw = array('d', [1.5, 2.5, 3.5, 4.5]).tobytes()
+    print(list(PointArray.frombuffer(raw)))
+    # >> [Point(x=1.5, y=2.5), Point(x=3.5, y=4.5)]
+
+    n = 1000000
+    coords = [random.random() for _ in range(2 * n)]
+    tracemalloc.start()
+    as_points = [Point(coords[i], coords[i + 1]) for i in range(0, 2 * n, 2)]
+    print('{} Points: {:.1f} MB'.format(
+        n, tracemalloc.get_traced_memory()[0] / 2**20))
+    del as_points
+    tracemalloc.stop()
+    tracemalloc.start()
+    as_array = PointArray.frombuffer(array('d', coords))
+    print('PointArray of {}: {:.1f} MB'.format(
+        n, tracemalloc.get_traced_memory()[0] / 2**20))
+    tracemalloc.stop()
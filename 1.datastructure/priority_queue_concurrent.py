@@ -0,0 +1,254 @@
+'''
+PriorityQueue from priority_queue.py can not be shared between threads
+or coroutines. The two variants below keep the same
+(-priority, index, item) entries, so items with equal priority still
+come out in the order they were pushed, and add:
+
+- ConcurrentPriorityQueue: a lock protected queue for threads with a
+  blocking get(timeout=...)
+- AsyncPriorityQueue: the same queue for asyncio with an awaitable get()
+
+push_many and pop_many take the lock (or touch the heap) once for a
+whole batch instead of once per item.
+'''
+# before anything that imports heapq, see stdlib_heapq
+import stdlib_heapq  # noqa: F401
+
+import asyncio
+import heapq
+import threading
+import time
+from collections import deque
+from queue import Empty
+
+from priority_queue import Item, PriorityQueue
+
+
+class _BatchMixin:
+    '''Batch helpers shared by both queues. The caller holds the lock.'''
+
+    def _make_entries(self, items):
+        entries = []
+        index = self._index
+        for item, priority in items:
+            entries.append((-priority, index, item))
+            index += 1
+        self._index = index
+        return entries
+
+    def _merge(self, entries):
+        heap = self._heap
+        size = len(heap) + len(entries)
+        # heapify on the combined list costs O(n + k), k heappush calls
+        # cost O(k log(n + k)). Pick whichever is cheaper for this batch
+        if len(entries) * size.bit_length() > size:
+            heap.extend(entries)
+            heapq.heapify(heap)
+        else:
+            for entry in entries:
+                heapq.heappush(heap, entry)
+
+    def _pop(self, n):
+        heap = self._heap
+        if n >= len(heap):
+            entries = sorted(heap)
+            heap.clear()
+        else:
+            entries = [heapq.heappop(heap) for _ in range(n)]
+        return [entry[-1] for entry in entries]
+
+
+class ConcurrentPriorityQueue(_BatchMixin, PriorityQueue):
+    def __init__(self):
+        super().__init__()
+        self._not_empty = threading.Condition(threading.Lock())
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, item, priority):
+        with self._not_empty:
+            super().push(item, priority)
+            self._not_empty.notify()
+
+    def push_many(self, items):
+        '''Push an iterable of (item, priority) pairs'''
+        items = list(items)
+        with self._not_empty:
+            self._merge(self._make_entries(items))
+            self._not_empty.notify(len(items))
+
+    def get(self, block=True, timeout=None):
+        '''
+        Remove and return the highest priority item. Wait up to timeout
+        seconds for one to arrive and raise queue.Empty if none does
+        '''
+        return self.pop_many(1, block, timeout)[0]
+
+    def pop_many(self, n, block=True, timeout=None):
+        '''
+        Remove and return up to n items, highest priority first. Waits
+        like get() when the queue is empty
+        '''
+        with self._not_empty:
+            if not self._heap:
+                if not block or not self._not_empty.wait_for(
+                        lambda: self._heap, timeout):
+                    raise Empty
+            return self._pop(n)
+
+    def heapMin(self):
+        with self._not_empty:
+            return super().heapMin()
+
+    def extractHeapMin(self):
+        with self._not_empty:
+            return super().extractHeapMin()
+
+    def __repr__(self):
+        with self._not_empty:
+            return super().__repr__()
+
+
+class AsyncPriorityQueue(_BatchMixin, PriorityQueue):
+    '''
+    Coroutines of a single event loop never run concurrently, so no lock
+    is needed. Getters waiting on an empty queue park on a future which
+    is resolved by the next push
+    '''
+    def __init__(self):
+        super().__init__()
+        self._getters = deque()
+
+    def __len__(self):
+        return len(self._heap)
+
+    def _wakeup(self, n=1):
+        while n and self._getters:
+            getter = self._getters.popleft()
+            if not getter.done():
+                getter.set_result(None)
+                n -= 1
+
+    def push(self, item, priority):
+        super().push(item, priority)
+        self._wakeup()
+
+    def push_many(self, items):
+        '''Push an iterable of (item, priority) pairs'''
+        entries = self._make_entries(items)
+        self._merge(entries)
+        self._wakeup(len(entries))
+
+    async def get(self, timeout=None):
+        '''
+        Remove and return the highest priority item. Raise
+        asyncio.TimeoutError if nothing arrives within timeout seconds
+        '''
+        return (await self.pop_many(1, timeout))[0]
+
+    async def pop_many(self, n, timeout=None):
+        '''Remove and return up to n items, highest priority first'''
+        if not self._heap:
+            await asyncio.wait_for(self._wait_not_empty(), timeout)
+        return self._pop(n)
+
+    def get_nowait(self):
+        if not self._heap:
+            raise Empty
+        return self._pop(1)[0]
+
+    async def _wait_not_empty(self):
+        loop = asyncio.get_running_loop()
+        while not self._heap:
+            getter = loop.create_future()
+            self._getters.append(getter)
+            try:
+                await getter
+            except BaseException:
+                getter.cancel()
+                # Pass the wakeup on if this getter was woken and cancelled
+                if self._heap and not getter.cancelled():
+                    self._wakeup()
+                raise
+
+
+def benchmark(nitems=200000, nworkers=4, batch=256):
+    '''
+    Fill one shared queue and drain it with several threads: the plain
+    PriorityQueue behind a global lock, as it had to be shared before,
+    then ConcurrentPriorityQueue one item per get() and batch at a time
+    with pop_many()
+    '''
+    import random
+
+    items = [(Item(i), random.randrange(100)) for i in range(nitems)]
+    lock = threading.Lock()
+
+    def fill_locked(pq):
+        for item, priority in items:
+            with lock:
+                pq.push(item, priority)
+
+    def fill_batch(pq):
+        pq.push_many(items)
+
+    def take_locked(pq):
+        with lock:
+            try:
+                return pq.extractHeapMin()
+            except IndexError:
+                raise Empty from None
+
+    def drain(pq, take):
+        while True:
+            try:
+                take(pq)
+            except Empty:
+                return
+
+    for label, make, fill, take in (
+            ('global lock', PriorityQueue, fill_locked, take_locked),
+            ('get()', ConcurrentPriorityQueue, fill_batch,
+             lambda pq: pq.get(timeout=0.01)),
+            ('pop_many({})'.format(batch), ConcurrentPriorityQueue, fill_batch,
+             lambda pq: pq.pop_many(batch, timeout=0.01))):
+        pq = make()
+        start = time.perf_counter()
+        fill(pq)
+        workers = [threading.Thread(target=drain, args=(pq, take))
+                   for _ in range(nworkers)]
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - start
+        print('{:>14}: {} items, {} threads, {:.3f}s'.format(
+            label, nitems, nworkers, elapsed))
+
+
+if __name__ == '__main__':
+    pq = ConcurrentPriorityQueue()
+    pq.push_many([(Item('1'), 10), (Item('2'), 12), (Item('6'), 10),
+                  (Item('3'), 3), (Item('4'), 5), (Item('5'), 1)])
+    print(pq.get())
+    # >> Item '2'
+    print(pq.pop_many(2))
+    # >> [Item '1', Item '6']
+
+    async def main():
+        apq = AsyncPriorityQueue()
+
+        async def producer():
+            await asyncio.sleep(0.01)
+            apq.push_many([(Item('a'), 1), (Item('b'), 5)])
+
+        asyncio.ensure_future(producer())
+        print(await apq.get(timeout=1))
+        # >> Item 'b'
+        print(await apq.get(timeout=1))
+        # >> Item 'a'
+
+    asyncio.run(main())
+    print('-x-'*30)
+    benchmark()
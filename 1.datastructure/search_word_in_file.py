@@ -1,18 +1,62 @@
+import io
+import mmap
+
+from search_word_in_file_mmap import MultiPatternSearch
+from search_word_index import indexed_lines
+
+
 def highlight(word, line):
     return line.replace(word, '\x1b[31m{}\x1b[0m'.format(word))
 
 
+def _reads_as_bytes(file):
+    '''
+    Can the byte-level engines answer for file: a file on disk read
+    from its start, whose lines end in \\n only, so they are the lines
+    iterating over it gives whatever its newline setting
+    '''
+    try:
+        file.fileno()
+        if file.tell() != 0:
+            return False
+    except (AttributeError, OSError, io.UnsupportedOperation):
+        return False
+    with open(file.name, 'rb') as raw:
+        try:
+            with mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return mm.find(b'\r') == -1
+        except ValueError:
+            # empty files can not be mapped, and have no lines
+            return True
+
+
 def search(word, file):
     '''
     search for a text in a file
     and return latest line with previous lines
     which contains the text
     '''
-    current_line = None
-    for line in f:
-        if word in line:
-            current_line = highlight(word, line)
-            yield current_line
+    if not _reads_as_bytes(file):
+        # Partly read, CR line endings or not backed by a real file (e.g.
+        # StringIO): scan the rest line by line, as the file reads it
+        for line in file:
+            if word in line:
+                yield highlight(word, line)
+        return
+    lines = indexed_lines(word, file)
+    if lines is not None:
+        # A fresh index answers without reading the rest of the file
+        for line in lines:
+            yield highlight(word, line)
+    else:
+        # Files on disk go through the memory-mapped engine
+        encoding = getattr(file, 'encoding', None) or 'utf-8'
+        errors = getattr(file, 'errors', None) or 'strict'
+        engine = MultiPatternSearch([word.encode(encoding)])
+        for _, _, line, _ in engine.search_lines(file.name):
+            yield highlight(word, line.decode(encoding, errors))
+    # the file is left where the line by line scan leaves it
+    file.seek(0, io.SEEK_END)
 
 
 if __name__ == '__main__':
@@ -7,6 +7,8 @@ matching line along with the previous N lines of context when found:
 
 from collections import deque
 
+from search_word_index import indexed_lines
+
 
 def highlight(word, line):
     return line.replace(word, '\x1b[31m{}\x1b[0m'.format(word))
@@ -19,7 +21,9 @@ def search(word, file, n=5):
     which contains the text
     '''
     prev_lines = deque(maxlen=n)
-    for line in f:
+    # With a fresh index only the lines containing word are read
+    lines = indexed_lines(word, file)
+    for line in file if lines is None else lines:
         if word in line:
             current_line = highlight(word, line)
             yield current_line, prev_lines
@@ -0,0 +1,131 @@
+'''
+Searching a file for many words with search_word_in_file.search means
+one pass over the file per word. MultiPatternSearch memory-maps the file
+and finds all the words in a single pass over the raw bytes with an
+Aho-Corasick automaton. Results are yielded lazily as
+(pattern, line number, byte offset) tuples.
+'''
+import mmap
+import re
+from collections import deque
+
+
+class MultiPatternSearch:
+    def __init__(self, patterns):
+        self.patterns = list(patterns)
+        encoded = [p.encode() if isinstance(p, str) else bytes(p)
+                   for p in self.patterns]
+        if not encoded or not all(encoded):
+            raise ValueError('patterns must be non-empty')
+        if any(b'\n' in p for p in encoded):
+            raise ValueError('patterns can not span lines')
+        self._lengths = [len(p) for p in encoded]
+        self._build(encoded)
+        # Lines are first checked with one regex in C, the automaton only
+        # runs on lines that contain at least one of the patterns and
+        # starts at the leftmost match
+        self._prefilter = re.compile(b'|'.join(
+            re.escape(p) for p in sorted(encoded, key=len, reverse=True)))
+
+    def _build(self, encoded):
+        goto = [{}]
+        output = [[]]
+        for index, pattern in enumerate(encoded):
+            state = 0
+            for byte in pattern:
+                if byte not in goto[state]:
+                    goto.append({})
+                    output.append([])
+                    goto[state][byte] = len(goto) - 1
+                state = goto[state][byte]
+            output[state].append(index)
+
+        # Breadth first over the trie: the failure link of a state is the
+        # longest proper suffix that is also in the trie. Merging in the
+        # transitions of the failure state gives a full transition table
+        # (a DFA), so scanning needs a single dict lookup per byte
+        fail = [0] * len(goto)
+        delta = [dict(goto[0])] + [None] * (len(goto) - 1)
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            fallback = delta[fail[state]]
+            delta[state] = {**fallback, **goto[state]}
+            output[state] = output[state] + output[fail[state]]
+            for byte, child in goto[state].items():
+                fail[child] = fallback.get(byte, 0)
+                queue.append(child)
+        self._delta = delta
+        self._output = [tuple(out) for out in output]
+
+    def scan(self, data, start=0, end=None):
+        '''Yield (pattern index, start offset) of every match in data'''
+        delta = self._delta
+        output = self._output
+        lengths = self._lengths
+        state = 0
+        end = len(data) if end is None else end
+        for pos in range(start, end):
+            state = delta[state].get(data[pos], 0)
+            if output[state]:
+                for index in output[state]:
+                    yield index, pos + 1 - lengths[index]
+
+    def search_lines(self, path):
+        '''
+        Yield (line number, offset of the line, line, matches) for every
+        line that contains a pattern, matches being (index, start) pairs
+        relative to the line
+        '''
+        with open(path, 'rb') as f:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:
+                # empty files can not be mapped
+                return
+            with mm:
+                prefilter = self._prefilter.search
+                lineno = 1
+                pos = 0
+                size = len(mm)
+                while pos < size:
+                    m = prefilter(mm, pos)
+                    if m is None:
+                        return
+                    # Count the lines skipped over without a match
+                    line_start = mm.rfind(b'\n', pos, m.start()) + 1
+                    if line_start:
+                        lineno += _count_newlines(mm, pos, line_start)
+                    else:
+                        line_start = pos
+                    line_end = mm.find(b'\n', m.start())
+                    line_end = size if line_end == -1 else line_end + 1
+                    line = mm[line_start:line_end]
+                    matches = list(self.scan(line, m.start() - line_start))
+                    yield lineno, line_start, line, matches
+                    lineno += 1
+                    pos = line_end
+
+    def search_file(self, path):
+        '''Yield (pattern, line number, byte offset) for every match'''
+        patterns = self.patterns
+        for lineno, line_start, line, matches in self.search_lines(path):
+            for index, start in matches:
+                yield patterns[index], lineno, line_start + start
+
+
+def _count_newlines(mm, start, end, blocksize=1 << 20):
+    count = 0
+    for block in range(start, end, blocksize):
+        count += mm[block:min(block + blocksize, end)].count(b'\n')
+    return count
+
+
+def search_patterns(patterns, path):
+    return MultiPatternSearch(patterns).search_file(path)
+
+
+if __name__ == '__main__':
+    words = ['Django', 'model', 'data', 'integrity']
+    for word, lineno, offset in search_patterns(words, 'sometext.txt'):
+        print('{:>10} line {:>4} offset {:>6}'.format(word, lineno, offset))
@@ -0,0 +1,158 @@
+'''
+search_word_in_file_deque.search reads the file one line at a time on a
+single core. parallel_search splits the file into byte ranges that
+start and end on line boundaries and searches the ranges in a process
+pool. Every match comes back with the n lines before and after it, also
+when those lines belong to a neighbouring range, and results are
+yielded in file order.
+
+Only a few ranges are in flight at any time, so memory use depends on
+the chunk size and the number of workers but not on the file size.
+'''
+# before anything that imports heapq, see stdlib_heapq
+import stdlib_heapq  # noqa: F401
+
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from search_word_in_file_deque import highlight
+
+
+def chunk_ranges(path, chunk_size):
+    '''Yield (start, end) byte ranges of about chunk_size, cut after a newline'''
+    with open(path, 'rb') as f:
+        size = os.fstat(f.fileno()).st_size
+        start = 0
+        while start < size:
+            end = start + chunk_size
+            if end < size:
+                f.seek(end)
+                f.readline()
+                end = f.tell()
+            else:
+                end = size
+            yield start, end
+            start = end
+
+
+def lines_before(f, pos, n, blocksize=1 << 16):
+    '''Return the n lines that end right before byte offset pos'''
+    if n == 0 or pos == 0:
+        return []
+    read_from = pos
+    while True:
+        read_from = max(0, read_from - blocksize)
+        f.seek(read_from)
+        data = f.read(pos - read_from)
+        # n complete lines need n + 1 newlines unless the file starts here
+        if read_from == 0 or data.count(b'\n') > n:
+            return data.splitlines(keepends=True)[-n:]
+        blocksize *= 2
+
+
+def search_range(path, word, start, end, n=5, encoding='utf-8'):
+    '''
+    Search the lines in [start, end) and return (number of lines, matches)
+    where matches are (line index within the range, line, before, after)
+    '''
+    with open(path, 'rb') as f:
+        head = lines_before(f, start, n)
+        f.seek(start)
+        data = f.read(end - start)
+        # The after-context of the last lines spills into the next range
+        tail = [line for line in (f.readline() for _ in range(n)) if line]
+    nlines = data.count(b'\n') + (not data.endswith(b'\n'))
+    # The range is decoded once and searched with str.find, lines are only
+    # cut out around the matches. Each part ends on a line boundary so
+    # the parts can be decoded separately
+    head = b''.join(head).decode(encoding, errors='replace')
+    data = data.decode(encoding, errors='replace')
+    text = head + data + b''.join(tail).decode(encoding, errors='replace')
+    size = len(text)
+    stop = len(head) + len(data)
+    matches = []
+    index = 0
+    counted = len(head)
+    pos = text.find(word, counted)
+    while pos != -1 and pos < stop:
+        line_start = text.rfind('\n', 0, pos) + 1
+        line_end = text.find('\n', pos)
+        line_end = size if line_end == -1 else line_end + 1
+        index += text.count('\n', counted, line_start)
+        counted = line_start
+        before = []
+        start = line_start
+        while start > 0 and len(before) < n:
+            prev = text.rfind('\n', 0, start - 1) + 1
+            before.insert(0, text[prev:start])
+            start = prev
+        after = []
+        end = line_end
+        while end < size and len(after) < n:
+            following = text.find('\n', end)
+            following = size if following == -1 else following + 1
+            after.append(text[end:following])
+            end = following
+        matches.append((index, highlight(word, text[line_start:line_end]),
+                        before, after))
+        pos = text.find(word, line_end)
+    return nlines, matches
+
+
+def parallel_search(word, path, n=5, workers=None, chunk_size=1 << 24,
+                    encoding='utf-8'):
+    '''
+    Yield (line number, line, before, after) for every line of path that
+    contains word, before and after holding up to n lines of context
+    '''
+    workers = workers or os.cpu_count()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        in_flight = deque()
+        lineno = 1
+
+        def drain_one():
+            nonlocal lineno
+            nlines, matches = in_flight.popleft().result()
+            for index, line, before, after in matches:
+                yield lineno + index, line, before, after
+            lineno += nlines
+
+        for start, end in chunk_ranges(path, chunk_size):
+            in_flight.append(pool.submit(
+                search_range, path, word, start, end, n, encoding))
+            if len(in_flight) >= 2 * workers:
+                yield from drain_one()
+        while in_flight:
+            yield from drain_one()
+
+
+def benchmark(path, word='Django', n=3, chunk_size=1 << 22):
+    import time
+    from search_word_in_file_deque import search
+
+    start = time.perf_counter()
+    with open(path) as f:
+        count = sum(1 for _ in search(word, f, n))
+    print('{:>12}: {} matches, {:.3f}s'.format(
+        'single core', count, time.perf_counter() - start))
+
+    workers = 1
+    while workers <= os.cpu_count():
+        start = time.perf_counter()
+        count = sum(1 for _ in parallel_search(word, path, n, workers,
+                                               chunk_size))
+        print('{:>12}: {} matches, {:.3f}s'.format(
+            '{} workers'.format(workers), count,
+            time.perf_counter() - start))
+        workers *= 2
+
+
+if __name__ == '__main__':
+    word = 'Django'
+    for lineno, line, before, after in parallel_search(
+            word, 'sometext.txt', n=1, chunk_size=1024):
+        print(''.join(before), end='')
+        print('{}: {}'.format(lineno, line), end='')
+        print(''.join(after), end='')
+        print('-x-'*30)
@@ -0,0 +1,294 @@
+'''
+Both search modules scan the whole file for every query. WordIndex
+tokenizes the file once and saves an inverted index next to it
+(sometext.txt -> sometext.txt.idx). The index maps every word to the
+lines it appears on, stored as delta encoded (line number, byte offset)
+pairs. A query reads only the candidate lines from the file.
+
+search() has always matched substrings (`word in line`), and the index
+keeps it that way: a word made of word characters can only occur inside
+a token, so the lines of every indexed term containing the word are the
+candidates, and each one is checked with `word in line`. Any other word
+is searched by scanning the file.
+
+The index file is a line of JSON with the counters and the terms
+followed by the postings bytes, nothing in it is executed when loaded.
+
+When lines are appended to the file, update() indexes just the new part.
+The search functions use the index only when it is fresh. Otherwise
+they scan the file as before.
+'''
+import codecs
+import json
+import os
+import re
+import zlib
+
+TOKEN = re.compile(r'\w+')
+VERSION = 2
+MAGIC = b'WORDINDEX'
+
+
+def encode_varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def decode_varints(data):
+    value = shift = 0
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            yield value
+            value = shift = 0
+
+
+def tokenize(line):
+    return set(TOKEN.findall(line))
+
+
+def _checksum(f, end, chunk_size=1 << 20):
+    '''crc32 of the first end bytes of f'''
+    f.seek(0)
+    crc = 0
+    while end > 0:
+        data = f.read(min(chunk_size, end))
+        if not data:
+            break
+        crc = zlib.crc32(data, crc)
+        end -= len(data)
+    return crc
+
+
+class WordIndex:
+    def __init__(self, path, index_path=None):
+        self.path = path
+        self.index_path = index_path or path + '.idx'
+        self.encoding = 'utf-8'
+        self.indexed_to = 0     # byte offset right after the last line indexed
+        self.nlines = 0
+        self.checksum = 0       # crc32 of all the bytes before indexed_to
+        self.size = self.mtime_ns = None
+        self.postings = {}      # term -> delta encoded postings
+        self._last = None       # term -> last (line number, offset)
+        self._grams = None      # trigram -> terms containing it
+
+    @classmethod
+    def build(cls, path, index_path=None):
+        index = cls(path, index_path)
+        index._index_from(0)
+        index.save()
+        return index
+
+    @classmethod
+    def load(cls, path, index_path=None):
+        '''Return the saved index of path, or None when there is none'''
+        index = cls(path, index_path)
+        try:
+            with open(index.index_path, 'rb') as f:
+                if f.readline() != b'%s %d\n' % (MAGIC, VERSION):
+                    return None
+                state = json.loads(f.readline())
+                data = f.read()
+            terms = state.pop('terms')
+            postings = {}
+            start = 0
+            for term, length in terms:
+                postings[term] = data[start:start + length]
+                start += length
+        except (OSError, ValueError, KeyError, TypeError):
+            return None
+        if start != len(data):
+            return None
+        for key in ('encoding', 'indexed_to', 'nlines', 'checksum', 'size',
+                    'mtime_ns'):
+            if key not in state:
+                return None
+            setattr(index, key, state[key])
+        index.postings = postings
+        return index
+
+    @classmethod
+    def load_fresh(cls, path, index_path=None):
+        '''Return the saved index of path if it matches the file on disk'''
+        index = cls.load(path, index_path)
+        if index is not None and index.is_fresh():
+            return index
+        return None
+
+    def save(self):
+        state = {key: getattr(self, key)
+                 for key in ('encoding', 'indexed_to', 'nlines', 'checksum',
+                             'size', 'mtime_ns')}
+        state['terms'] = [[term, len(data)]
+                          for term, data in self.postings.items()]
+        tmp = self.index_path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(b'%s %d\n' % (MAGIC, VERSION))
+            f.write(json.dumps(state).encode('utf-8') + b'\n')
+            for data in self.postings.values():
+                f.write(data)
+        os.replace(tmp, self.index_path)
+
+    def is_fresh(self):
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            return False
+        return st.st_size == self.size and st.st_mtime_ns == self.mtime_ns
+
+    def update(self):
+        '''
+        Index lines appended since the last build or update. Rebuilds
+        from scratch when the file was changed in any other way. Returns
+        the number of lines added to the index
+        '''
+        if self.is_fresh():
+            return 0
+        with open(self.path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            appended = (size >= self.indexed_to and
+                        _checksum(f, self.indexed_to) == self.checksum)
+        before = self.nlines
+        if not appended:
+            self.__init__(self.path, self.index_path)
+            before = 0
+        self._index_from(self.indexed_to)
+        self.save()
+        return self.nlines - before
+
+    def _index_from(self, start):
+        postings = self.postings
+        if self._last is None:
+            # Not saved to keep the file small, rebuilt from the postings
+            self._last = {term: self.lookup(term)[-1] for term in postings}
+        last = self._last
+        self._grams = None
+        lineno = self.nlines
+        offset = start
+        # continued over the new lines: the bytes before start are the
+        # ones self.checksum covers
+        crc = self.checksum
+        with open(self.path, 'rb') as f:
+            st = os.fstat(f.fileno())
+            f.seek(start)
+            for raw in f:
+                if not raw.endswith(b'\n'):
+                    # A line still being written is left for the next
+                    # update, queries scan it directly
+                    break
+                lineno += 1
+                for term in tokenize(raw.decode(self.encoding, 'replace')):
+                    data = postings.get(term)
+                    if data is None:
+                        data = postings[term] = bytearray()
+                        last_line = last_offset = 0
+                    else:
+                        if not isinstance(data, bytearray):
+                            data = postings[term] = bytearray(data)
+                        last_line, last_offset = last[term]
+                    encode_varint(lineno - last_line, data)
+                    encode_varint(offset - last_offset, data)
+                    last[term] = lineno, offset
+                offset += len(raw)
+                crc = zlib.crc32(raw, crc)
+        self.checksum = crc
+        self.nlines = lineno
+        self.indexed_to = offset
+        self.size = st.st_size
+        self.mtime_ns = st.st_mtime_ns
+
+    def lookup(self, word):
+        '''Return the (line number, byte offset) of every line containing word'''
+        data = self.postings.get(word)
+        if data is None:
+            return []
+        values = decode_varints(data)
+        result = []
+        lineno = offset = 0
+        for line_delta in values:
+            lineno += line_delta
+            offset += next(values)
+            result.append((lineno, offset))
+        return result
+
+    def _terms_containing(self, word):
+        if len(word) < 3:
+            # too short for a trigram, every term is looked at
+            return [term for term in self.postings if word in term]
+        grams = self._grams
+        if grams is None:
+            # Built on the first query, not saved: terms are short, this
+            # is one pass over the vocabulary
+            grams = self._grams = {}
+            for term in self.postings:
+                for i in range(len(term) - 2):
+                    grams.setdefault(term[i:i + 3], set()).add(term)
+        # the terms holding every trigram of word, then an exact check
+        found = None
+        for i in range(len(word) - 2):
+            terms = grams.get(word[i:i + 3])
+            if not terms:
+                return []
+            found = set(terms) if found is None else found & terms
+        return [term for term in found if word in term]
+
+    def candidates(self, word):
+        '''
+        Return the sorted byte offsets of the indexed lines that may
+        contain word: the lines of every term that has word in it. The
+        terms are found through a table of their trigrams, only a word
+        shorter than three characters looks at every term
+        '''
+        offsets = set()
+        for term in self._terms_containing(word):
+            offsets.update(offset for _, offset in self.lookup(term))
+        return sorted(offsets)
+
+    def lines(self, word):
+        '''Yield the lines of the file that contain word, in file order'''
+        with open(self.path, 'rb') as f:
+            for offset in self.candidates(word):
+                f.seek(offset)
+                line = f.readline().decode(self.encoding, 'replace')
+                if word in line:
+                    yield line
+            # whatever was not indexed yet is scanned
+            f.seek(self.indexed_to)
+            for raw in f:
+                line = raw.decode(self.encoding, 'replace')
+                if word in line:
+                    yield line
+
+
+def indexed_lines(word, file):
+    '''
+    Return the lines containing word from a fresh index of file, or None
+    when the caller has to scan. Only a word made of word characters is
+    sure to sit inside one token, any other word scans
+    '''
+    if TOKEN.fullmatch(word) is None:
+        return None
+    path = getattr(file, 'name', None)
+    if not isinstance(path, str):
+        return None
+    encoding = getattr(file, 'encoding', None) or 'utf-8'
+    if codecs.lookup(encoding).name != 'utf-8':
+        # the index decodes the file as utf-8
+        return None
+    index = WordIndex.load_fresh(path)
+    if index is None:
+        return None
+    return index.lines(word)
+
+
+if __name__ == '__main__':
+    index = WordIndex.build('sometext.txt')
+    print('{} lines, {} terms, index {} bytes'.format(
+        index.nlines, len(index.postings), os.path.getsize(index.index_path)))
+    for lineno, offset in index.lookup('Django'):
+        print(lineno, offset)
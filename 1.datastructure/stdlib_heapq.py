@@ -0,0 +1,24 @@
+'''
+heapq.py in this directory is a recipe named after the module it shows.
+A script run from here has the directory first on sys.path, so
+`import heapq`, also the one inside asyncio, multiprocessing and
+concurrent.futures, would load the recipe instead of the standard
+module and fail with "partially initialized module 'heapq'".
+
+Scripts that need the standard heapq import this module before anything
+else: it imports heapq with the directory taken off sys.path, and every
+later import finds the standard module in sys.modules.
+'''
+import os
+import sys
+
+_here = os.path.dirname(os.path.abspath(__file__))
+
+if 'heapq' not in sys.modules:
+    _path = sys.path[:]
+    sys.path[:] = [entry for entry in _path
+                   if os.path.abspath(entry or os.curdir) != _here]
+    try:
+        import heapq  # noqa: F401
+    finally:
+        sys.path[:] = _path
@@ -0,0 +1,287 @@
+'''
+Product and Book in descriptors.py check every field in the
+descriptor's __set__, one value at a time. Loading millions of rows
+that way pays a Python call, an isinstance and a range check per field
+per row. create_many() validates whole columns first and then builds
+the instances without going through __set__ again.
+
+The rules are not repeated here. A descriptor's validate(value) stays
+the only definition of a valid value. A descriptor that sets
+`vectorized = True` declares that validate() checks nothing but its
+expected_type, minimum and maximum attributes. Those rules are checked
+on the whole column at once:
+
+- NumPy arrays with a few array comparisons
+- lists with set(map(type, ...)), min() and max(), which run in C
+
+validate() only runs on the rows when the column check fails, to find
+them and raise exactly the error an assignment would raise. Errors from
+all rows are collected and raised together in a ValidationError that
+lists (row, field, error).
+'''
+import gc
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# dtype kinds whose values pass isinstance(value, type) once converted
+# to Python objects with tolist()
+_KINDS = {bool: 'b', int: 'biu', float: 'f', complex: 'c', str: 'U'}
+# Types that min() and max() order the same way validate() compares them
+_NUMBERS = {bool, int, float}
+
+_BUILD_TEMPLATE = '''\
+def build(cls, new, {columns}):
+    instances = []
+    append = instances.append
+    for {values}, in zip({columns}):
+        self = new(cls)
+{stores}
+        append(self)
+    return instances
+'''
+
+
+class ValidationError(ValueError):
+    def __init__(self, errors):
+        self.errors = errors
+        shown = '; '.join('row {}, {}: {}'.format(row, field, error)
+                          for row, field, error in errors[:5])
+        more = len(errors) - 5
+        if more > 0:
+            shown += '; ... {} more'.format(more)
+        super().__init__('{} invalid values: {}'.format(len(errors), shown))
+
+
+def _class_attribute(cls, name):
+    '''Look name up on cls without calling a descriptor's __get__'''
+    for klass in cls.__mro__:
+        if name in klass.__dict__:
+            return klass.__dict__[name]
+    return None
+
+
+def _kinds(expected_type):
+    if not isinstance(expected_type, tuple):
+        expected_type = (expected_type,)
+    kinds = ''
+    for t in expected_type:
+        if t not in _KINDS:
+            return None
+        kinds += _KINDS[t]
+    return kinds
+
+
+def _array_suspects(descriptor, array):
+    '''Return the rows of a NumPy array that may be invalid, or None for all'''
+    if array.ndim != 1:
+        return None
+    expected_type = getattr(descriptor, 'expected_type', None)
+    if expected_type is not None:
+        kinds = _kinds(expected_type)
+        if kinds is None or array.dtype.kind not in kinds:
+            return None
+    minimum = getattr(descriptor, 'minimum', None)
+    maximum = getattr(descriptor, 'maximum', None)
+    if minimum is None and maximum is None:
+        return []
+    if array.dtype.kind not in 'biuf':
+        return None
+    # NaN compares false both ways, in NumPy as in validate()
+    bad = np.zeros(len(array), dtype=bool)
+    if minimum is not None:
+        bad |= array < minimum
+    if maximum is not None:
+        bad |= array > maximum
+    return np.flatnonzero(bad).tolist()
+
+
+def _list_suspects(descriptor, values):
+    '''Return [] when every value passes the declared rules, else None'''
+    types = set(map(type, values))
+    expected_type = getattr(descriptor, 'expected_type', None)
+    if expected_type is not None and not all(
+            issubclass(t, expected_type) for t in types):
+        return None
+    minimum = getattr(descriptor, 'minimum', None)
+    maximum = getattr(descriptor, 'maximum', None)
+    if values and (minimum is not None or maximum is not None):
+        if not types <= _NUMBERS:
+            return None
+        # A NaN may hide other values from min() and max(), but then it
+        # is returned itself and the comparison below fails
+        if minimum is not None and not minimum <= min(values):
+            return None
+        if maximum is not None and not max(values) <= maximum:
+            return None
+    return []
+
+
+def validate_column(descriptor, name, column):
+    '''
+    Return (values, errors) where values is the column as a list and
+    errors lists (row, name, exception) for the values validate() rejects
+    '''
+    rows = None
+    if np is not None and isinstance(column, np.ndarray):
+        values = column.tolist()
+        if getattr(descriptor, 'vectorized', False):
+            rows = _array_suspects(descriptor, column)
+    else:
+        values = list(column)
+        if getattr(descriptor, 'vectorized', False):
+            rows = _list_suspects(descriptor, values)
+    if rows is None:
+        rows = range(len(values))
+    validate = descriptor.validate
+    errors = []
+    for row in rows:
+        try:
+            validate(values[row])
+        except (TypeError, ValueError) as e:
+            errors.append((row, name, e))
+    return values, errors
+
+
+def validate_columns(cls, columns):
+    '''
+    Check {field: column} against the descriptors of cls. Return the
+    columns as lists, or raise ValidationError listing every bad value
+    '''
+    result = {}
+    errors = []
+    length = None
+    for name, column in columns.items():
+        descriptor = _class_attribute(cls, name)
+        if hasattr(descriptor, 'validate'):
+            values, column_errors = validate_column(descriptor, name, column)
+            errors.extend(column_errors)
+        else:
+            values = list(column)
+        if length is None:
+            length = len(values)
+        elif len(values) != length:
+            raise ValueError('column {!r} has {} values, expected {}'.format(
+                name, len(values), length))
+        result[name] = values
+    if errors:
+        errors.sort(key=lambda error: error[0])
+        raise ValidationError(errors)
+    return result
+
+
+def _builder(cls, names):
+    '''
+    Compile a loop that creates the instances and stores one row of
+    values in each. Validated values go where __set__ would put them:
+    in the private attribute of a validated_descriptors field, through
+    the descriptor's store() method if it has one, else in the instance
+    __dict__ under the descriptor's name. Other attributes are assigned
+    normally
+    '''
+    namespace = {}
+    stores = []
+    for i, name in enumerate(names):
+        attribute = _class_attribute(cls, name)
+        private = getattr(attribute, 'private', None)
+        if isinstance(private, str) and private.isidentifier():
+            stores.append('self.{} = v{}'.format(private, i))
+        elif hasattr(attribute, 'store'):
+            namespace['_store%d' % i] = attribute.store
+            stores.append('_store{0}(self, v{0})'.format(i))
+        elif hasattr(attribute, 'validate'):
+            stores.append('self.__dict__[{!r}] = v{}'.format(
+                getattr(attribute, 'name', None) or name, i))
+        elif name.isidentifier():
+            stores.append('self.{} = v{}'.format(name, i))
+        else:
+            stores.append('setattr(self, {!r}, v{})'.format(name, i))
+    source = _BUILD_TEMPLATE.format(
+        columns=', '.join('c%d' % i for i in range(len(names))),
+        values=', '.join('v%d' % i for i in range(len(names))),
+        stores='\n'.join('        ' + store for store in stores),
+    )
+    exec(source, namespace)
+    return namespace['build']
+
+
+def create_many(cls, columns):
+    '''
+    Return one instance of cls per row of {field: column}. __init__ and
+    the descriptors' __set__ are not called: the columns are validated
+    as a whole and the values stored directly
+    '''
+    columns = validate_columns(cls, columns)
+    if not columns:
+        return []
+    build = _builder(cls, list(columns))
+    # Nothing allocated here is garbage, collections would only walk the
+    # growing list of instances again and again
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        return build(cls, cls.__new__, *columns.values())
+    finally:
+        if enabled:
+            gc.enable()
+
+
+def create_from_rows(cls, rows, fields):
+    '''create_many() for an iterable of rows with the given field order'''
+    columns = dict(zip(fields, map(list, zip(*rows))))
+    return create_many(cls, columns or {field: [] for field in fields})
+
+
+def benchmark(nrows=1000000):
+    import random
+    import time
+    import descriptors
+    import validated_descriptors
+
+    authors = ['author%d' % (i % 100) for i in range(nrows)]
+    titles = ['title%d' % i for i in range(nrows)]
+    prices = [random.randint(0, 100) for _ in range(nrows)]
+    columns = {'author': authors, 'title': titles, 'price': prices}
+    loads = [('one by one', lambda cls: list(map(cls, authors, titles, prices))),
+             ('create_many', lambda cls: create_many(cls, columns))]
+    if np is not None:
+        numpy_columns = dict(columns, price=np.array(prices))
+        loads.append(('create_many, NumPy prices',
+                      lambda cls: create_many(cls, numpy_columns)))
+
+    print('{} books'.format(nrows))
+    for cls in (descriptors.Book, validated_descriptors.Book):
+        for label, load in loads:
+            start = time.perf_counter()
+            books = load(cls)
+            elapsed = time.perf_counter() - start
+            del books
+            print('{:>28} {:>26}: {:.3f}s'.format(
+                cls.__module__ + '.Book', label, elapsed))
+
+
+if __name__ == '__main__':
+    from descriptors import Book, Product
+
+    books = create_from_rows(Book, [
+        ('William Faulkner', 'The Sound and the Fury', 12),
+        ('John Dos Passos', 'Manhattan Transfer', 13),
+    ], ('author', 'title', 'price'))
+    print([(str(b), b.price) for b in books])
+    # >> [('William Faulkner - The Sound and the Fury', 12), ('John Dos Passos - Manhattan Transfer', 13)]
+    try:
+        create_many(Product, {'name': ['pen', 'ink', 'pad'],
+                              'price': [3, 2.5, '4']})
+    except ValidationError as e:
+        print(e)
+    # >> 2 invalid values: row 1, price: price must be of type <class 'int'>; row 2, price: ...
+    try:
+        create_many(Book, {'author': ['a', 'b', 'c'], 'title': ['x', 'y', 'z'],
+                           'price': [50, 101, -1]})
+    except ValidationError as e:
+        print([(row, field) for row, field, _ in e.errors])
+    # >> [(1, 'price'), (2, 'price')]
+    print('-x-'*30)
+    benchmark()
@@ -0,0 +1,273 @@
+'''
+Celcius in descriptors.py computes 5 * (farenheit - 32) / 9 on every
+read. computed is a descriptor for derived attributes that are worth
+caching. It keeps the value per instance and recomputes it only after
+one of the attributes it depends on has been set:
+
+    class Temperature:
+        def __init__(self, farenheit):
+            self.farenheit = farenheit
+
+        @computed('farenheit')
+        def celcius(self):
+            return 5 * (self.farenheit - 32) / 9
+
+        @computed('celcius')
+        def kelvin(self):
+            return self.celcius + 273.15
+
+When the class is created, each plain attribute named as a dependency
+(farenheit) is replaced by a small data descriptor. Reads of it return
+the value from the instance __dict__ (or raise AttributeError when it
+was never set), and every assignment drops the cached values that
+depend on it. A dependency on
+another computed attribute (kelvin on celcius) is invalidated in turn
+when that one is, so chains stay consistent.
+
+The cached value is kept in the instance __dict__ under the attribute's
+own name. computed is a data descriptor, so every read goes through
+__get__ and is counted in hits or misses.
+'''
+from collections import namedtuple
+
+CacheInfo = namedtuple('CacheInfo', 'hits misses invalidations')
+_missing = object()
+
+
+def _class_attribute(owner, name):
+    for klass in owner.__mro__:
+        if name in klass.__dict__:
+            return klass.__dict__[name]
+    return None
+
+
+class _Tracked:
+    '''Replaces a plain attribute that computed values depend on'''
+
+    def __init__(self, name):
+        self.name = name
+        self.dependents = []
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        try:
+            return instance.__dict__[self.name]
+        except KeyError:
+            raise AttributeError('{!r} object has no attribute {!r}'.format(
+                owner.__name__, self.name)) from None
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.name] = value
+        for dependent in self.dependents:
+            dependent.invalidate(instance)
+
+    def __delete__(self, instance):
+        del instance.__dict__[self.name]
+        for dependent in self.dependents:
+            dependent.invalidate(instance)
+
+
+class _TrackedDefault(_Tracked):
+    '''_Tracked for an attribute with a default value on the class'''
+
+    def __init__(self, name, default):
+        super().__init__(name)
+        self.default = default
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self.default
+        return instance.__dict__.get(self.name, self.default)
+
+
+class _TrackedDescriptor(_Tracked):
+    '''_Tracked wrapped around a data descriptor such as a property'''
+
+    def __init__(self, name, descriptor):
+        super().__init__(name)
+        self.descriptor = descriptor
+
+    def __get__(self, instance, owner):
+        return self.descriptor.__get__(instance, owner)
+
+    def __set__(self, instance, value):
+        self.descriptor.__set__(instance, value)
+        for dependent in self.dependents:
+            dependent.invalidate(instance)
+
+    def __delete__(self, instance):
+        self.descriptor.__delete__(instance)
+        for dependent in self.dependents:
+            dependent.invalidate(instance)
+
+
+class computed:
+    def __init__(self, *depends_on, func=None):
+        self.depends_on = depends_on
+        self.func = func
+        self.fset = None
+        self.name = None
+        self.dependents = []
+        self.hits = self.misses = self.invalidations = 0
+
+    def __call__(self, func):
+        self.func = func
+        self.__doc__ = func.__doc__
+        return self
+
+    def setter(self, fset):
+        '''
+        Allow assignment through fset(instance, value). fset should set
+        the base attributes, which invalidates the cached value
+        '''
+        self.fset = fset
+        return self
+
+    def __set_name__(self, owner, name):
+        self.name = name
+        for dependency in self.depends_on:
+            attribute = _class_attribute(owner, dependency)
+            if not isinstance(attribute, (computed, _Tracked)):
+                if attribute is None:
+                    attribute = _Tracked(dependency)
+                elif hasattr(type(attribute), '__set__'):
+                    attribute = _TrackedDescriptor(dependency, attribute)
+                else:
+                    attribute = _TrackedDefault(dependency, attribute)
+                setattr(owner, dependency, attribute)
+            if self not in attribute.dependents:
+                attribute.dependents.append(self)
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self
+        cache = instance.__dict__
+        try:
+            value = cache[self.name]
+        except KeyError:
+            self.misses += 1
+            value = cache[self.name] = self.func(instance)
+            return value
+        self.hits += 1
+        return value
+
+    def __set__(self, instance, value):
+        if self.fset is None:
+            raise AttributeError("can't set attribute {!r}".format(self.name))
+        self.fset(instance, value)
+
+    def invalidate(self, instance):
+        '''Drop the cached value of instance and of everything built on it'''
+        # A dependent is computed from this value, so it can only be
+        # cached while this one is
+        if instance.__dict__.pop(self.name, _missing) is not _missing:
+            self.invalidations += 1
+            for dependent in self.dependents:
+                dependent.invalidate(instance)
+
+    def cache_info(self):
+        return CacheInfo(self.hits, self.misses, self.invalidations)
+
+    def reset_counters(self):
+        self.hits = self.misses = self.invalidations = 0
+
+
+class Temperature:
+    def __init__(self, farenheit):
+        self.farenheit = farenheit
+
+    @computed('farenheit')
+    def celcius(self):
+        return 5 * (self.farenheit - 32) / 9
+
+    @celcius.setter
+    def celcius(self, value):
+        self.farenheit = 32 + 9 * value / 5
+
+    @computed('celcius')
+    def kelvin(self):
+        return self.celcius + 273.15
+
+
+class Document:
+    '''A derived value worth caching: word statistics of a text'''
+
+    def __init__(self, text):
+        self.text = text
+
+    @computed('text')
+    def words(self):
+        return self.text.lower().split()
+
+    @computed('words')
+    def word_counts(self):
+        counts = {}
+        for word in self.words:
+            counts[word] = counts.get(word, 0) + 1
+        return counts
+
+    @computed('word_counts')
+    def most_common(self):
+        return max(self.word_counts.items(), key=lambda item: item[1])
+
+
+def benchmark(reads_per_write=100, rounds=2000):
+    import time
+    from descriptors import Farenheit
+
+    with open('sometext.txt') as f:
+        text = f.read()
+
+    class PlainDocument:
+        def __init__(self, text):
+            self.text = text
+
+        @property
+        def most_common(self):
+            counts = {}
+            for word in self.text.lower().split():
+                counts[word] = counts.get(word, 0) + 1
+            return max(counts.items(), key=lambda item: item[1])
+
+    def run(obj, attribute, base, values):
+        start = time.perf_counter()
+        for value in values:
+            setattr(obj, base, value)
+            for _ in range(reads_per_write):
+                getattr(obj, attribute)
+        return time.perf_counter() - start
+
+    cases = [
+        ('Celcius (recomputed)', Farenheit(0), 'celcius', 'farenheit',
+         range(rounds)),
+        ('computed celcius', Temperature(0), 'celcius', 'farenheit',
+         range(rounds)),
+        ('property most_common', PlainDocument(text), 'most_common', 'text',
+         [text] * (rounds // 100)),
+        ('computed most_common', Document(text), 'most_common', 'text',
+         [text] * (rounds // 100)),
+    ]
+    print('{} reads per write'.format(reads_per_write))
+    for label, obj, attribute, base, values in cases:
+        elapsed = run(obj, attribute, base, values)
+        print('{:>22}: {:8.1f}ns per read'.format(
+            label, elapsed / (len(values) * reads_per_write) * 1e9))
+    print(Temperature.celcius.cache_info())
+    print(Document.most_common.cache_info())
+
+
+if __name__ == '__main__':
+    t = Temperature(212)
+    print(t.celcius, t.kelvin)
+    # >> 100.0 373.15
+    t.farenheit = 32
+    print(t.celcius, t.kelvin)
+    # >> 0.0 273.15
+    t.celcius = 100
+    print(t.farenheit, t.kelvin)
+    # >> 212.0 373.15
+    print(Temperature.kelvin.cache_info())
+    # >> CacheInfo(hits=0, misses=3, invalidations=2)
+    print('-x-'*30)
+    benchmark()
@@ -1,6 +1,13 @@
 import random
+from array import array
+from itertools import islice
 from weakref import WeakKeyDictionary
 
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
 
 # This is a correct implementation as the instance of farenheit is being
 # used to get and set the value of the celcius property inside the Farenheit
@@ -22,24 +29,35 @@ class Farenheit:
 
 
 # Following is descriptor #2
-# this is a rather incorrect implementation since qty on product
-# instances will always be same since quantity is being set at the
-# class level of quantity
-# We shoud use a wekref dictionary so that the Descriptor class
-# rejects the last dictionary of the name, value pair of the property
+# A first attempt stored the value on the descriptor itself (self._value).
+# The descriptor lives on the class, so every Product ended up sharing
+# the same qty. The value has to be stored per instance: __set_name__
+# tells the descriptor which attribute it is bound to and the value goes
+# in the instance __dict__ under that name
 class Quantity(object):
-    _value = 0
+    # validate() only checks expected_type, so bulk_validation.py can
+    # check whole columns at once
+    expected_type = int
+    vectorized = True
+
+    def __set_name__(self, owner, name):
+        self.name = name
 
     def __get__(self, instance, owner):
-        return self._value
+        if instance is None:
+            return self
+        return instance.__dict__.get(self.name, 0)
 
     def __set__(self, instance, value):
-        if not isinstance(value, int):
+        instance.__dict__[self.name] = self.validate(value)
+
+    def validate(self, value):
+        if not isinstance(value, self.expected_type):
             raise TypeError("{} must be of type {}".format(
-                'qty',
-                int
+                self.name,
+                self.expected_type
             ))
-        self._value = value
+        return value
 
 
 class Product(object):
@@ -50,21 +68,32 @@ class Product(object):
         self.price = price
 
 
-# This descriptor is also wrongly implemented for the same reason as above
+# This descriptor used to be wrong for the same reason as above: the
+# price was kept in self.__price, on the descriptor, so all the books
+# had the last price that was set. It stores the price per instance now
 class Price1(object):
-    def __init__(self):
-        self.__price = 0
+    minimum = 0
+    maximum = 100
+    vectorized = True
+
+    def __set_name__(self, owner, name):
+        self.name = name
 
     def __get__(self, instance, owner):
-        return self.__price
+        if instance is None:
+            return self
+        return instance.__dict__.get(self.name, 0)
 
     def __set__(self, instance, value):
-        if value < 0 or value > 100:
+        instance.__dict__[self.name] = self.validate(value)
+
+    def validate(self, value):
+        if value < self.minimum or value > self.maximum:
             raise ValueError("Price must be between 0 and 100.")
-        self.__price = value
+        return value
 
     def __delete__(self, instance):
-        del self.__price
+        del instance.__dict__[self.name]
 
     def somefunction(self):
         print('hello')
@@ -73,12 +102,16 @@ class Price1(object):
 # 12
 # >>> b2 = Book("John Dos Passos", "Manhattan Transfer", 13)
 # >>> b1.price
-# 13
+# 12
 
 
 # Following is a correct implementation using the weakref
 # https://www.smallsurething.com/python-descriptors-made-simple/
 class Price2(object):
+    minimum = 0
+    maximum = 100
+    vectorized = True
+
     def __init__(self):
         self.default = 0
         self.values = WeakKeyDictionary()
@@ -87,8 +120,15 @@ class Price2(object):
         return self.values.get(instance, self.default)
 
     def __set__(self, instance, value):
-        if value < 0 or value > 100:
+        self.store(instance, self.validate(value))
+
+    def validate(self, value):
+        if value < self.minimum or value > self.maximum:
             raise ValueError("Price must be between 0 and 100.")
+        return value
+
+    # Save an already validated value, used by bulk_validation.py
+    def store(self, instance, value):
         self.values[instance] = value
 
     def __delete__(self, instance):
@@ -125,12 +165,62 @@ class Book(object):
 
 
 # Another example of a descriptor
+# Without a buffer_size every roll calls random.random(). With one, the
+# rolls are drawn buffer_size at a time and each access only takes the
+# next one from a list iterator. The block is drawn as random bytes
+# that bytes.translate() maps to faces (dropping the top 256 % sides
+# byte values keeps it uniform), or by NumPy's default_rng when it is
+# installed.
+# A seed makes the sequence of rolls reproducible on the same backend:
+# a buffered die is seeded with np.random.default_rng(seed) when NumPy
+# is installed and random.Random(seed) otherwise, and the two give
+# different rolls for the same seed. roll_many() returns an
+# array.array, of typecode 'B' for fewer than 256 sides and 'q'
+# otherwise, in every case
 class Die(object):
-    def __init__(self, sides=6):
+    def __init__(self, sides=6, seed=None, buffer_size=None):
         self.sides = sides
+        self.buffer_size = buffer_size
+        self._numpy = np is not None and bool(buffer_size)
+        if self._numpy:
+            self._rng = np.random.default_rng(seed)
+        else:
+            self._rng = random.Random(seed) if seed is not None else random
+        self._typecode = 'B' if sides < 256 else 'q'
+        self._rolls = iter(())
+        if sides < 256:
+            limit = 256 - 256 % sides
+            self._faces = bytes(b % sides + 1 for b in range(limit)) + bytes(
+                256 - limit)
+            self._rejected = bytes(range(limit, 256))
 
     def __get__(self, instance, owner):
-        return int(random.random() * self.sides) + 1
+        if self.buffer_size is None:
+            return int(self._rng.random() * self.sides) + 1
+        try:
+            return next(self._rolls)
+        except StopIteration:
+            self._rolls = iter(self._draw(self.buffer_size).tolist())
+            return next(self._rolls)
+
+    def _draw(self, n):
+        if self._numpy:
+            drawn = self._rng.integers(1, self.sides + 1, size=n)
+            dtype = np.uint8 if self._typecode == 'B' else np.int64
+            return array(self._typecode, drawn.astype(dtype).tobytes())
+        if self.sides >= 256:
+            sides, rand = self.sides, self._rng.random
+            return array('q', [int(rand() * sides) + 1 for _ in range(n)])
+        rolls = bytearray()
+        while len(rolls) < n:
+            rolls += self._rng.randbytes(n - len(rolls)).translate(
+                self._faces, self._rejected)
+        return array('B', rolls)
+
+    def roll_many(self, n):
+        """Return the next n rolls as an array"""
+        buffered = list(islice(self._rolls, n))
+        return array(self._typecode, buffered) + self._draw(n - len(buffered))
 
 
 class Game(object):
@@ -186,6 +276,31 @@ class Publisher(object):
 # http://www.ianbicking.org/blog/2008/10/decorators-and-descriptors.html
 
 
+def benchmark_dice(rolls=1000000):
+    import time
+    from collections import Counter
+
+    class BufferedGame(object):
+        d6 = Die(seed=1, buffer_size=65536)
+
+    for label, game in (('Die()', Game),
+                        ('Die(buffer_size=65536)', BufferedGame)):
+        start = time.perf_counter()
+        for _ in range(rolls):
+            game.d6
+        elapsed = time.perf_counter() - start
+        print('{:>24}: {:.1f}ns per roll'.format(
+            label, elapsed / rolls * 1e9))
+    die = Die(seed=1, buffer_size=65536)
+    start = time.perf_counter()
+    many = die.roll_many(rolls)
+    elapsed = time.perf_counter() - start
+    print('{:>24}: {:.1f}ns per roll'.format('roll_many', elapsed / rolls * 1e9))
+    counts = Counter(many.tolist())
+    print('frequencies:', {face: round(counts[face] / rolls, 4)
+                           for face in sorted(counts)})
+
+
 if __name__ == '__main__':
     f = Farenheit(100)
     f.celcius   # prints 37.77
@@ -201,3 +316,10 @@ if __name__ == '__main__':
     Game.d20
     game = Game()
     game.d20
+
+    seeded = Die(sides=6, seed=42, buffer_size=8)
+    print([seeded.__get__(None, Game) for _ in range(5)], seeded.roll_many(5))
+    # >> [2, 2, 4, 2, 2] array('B', [2, 3, 5, 2, 1]) without NumPy, other
+    # >> rolls, the same on every run, with it
+    print('-x-'*30)
+    benchmark_dice()
@@ -0,0 +1,274 @@
+'''
+Printing inside a getter, as Student and Publisher in descriptors.py
+do, tells which attribute is used but is far too slow to leave on.
+
+instrument(cls, name) replaces the descriptor or property cls.name with
+a wrapper that counts every get, set and delete and times one call in
+`sample` with perf_counter_ns. uninstrument(cls, name) puts the
+original object back, so an attribute that is not instrumented costs
+nothing at all.
+
+Each thread counts into its own lists (a threading.local per wrapper),
+so the hot path takes no lock. The lists are also kept in a registry
+that summary(), report() and to_json() merge when they are read. When
+a thread exits, its counters are added to per attribute totals and its
+lists dropped, so threads that come and go don't pile up. That part is
+thread_totals.py, shared with the profilers in 9.metaprogramming.
+'''
+import json
+import os
+import sys
+import threading
+from time import perf_counter_ns
+
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             os.pardir, '9.metaprogramming'))
+from thread_totals import ThreadTotals  # noqa: E402
+
+
+def _merge(totals, buffers):
+    '''Add the counters of an exited thread to totals'''
+    for label, operation, stats in buffers:
+        total = totals.setdefault((label, operation), [0, 0, 0, 0, 0])
+        total[0] += stats[0]
+        total[1] += stats[1]
+        total[2] += stats[2]
+        total[3] = max(total[3], stats[3])
+        total[4] += 1
+
+
+# Per live thread a list of (attribute, operation,
+# [calls, sampled, total_ns, max_ns]). Summed over the threads that
+# exited: (attribute, operation) -> [calls, sampled, total_ns, max_ns,
+# threads]
+_totals = ThreadTotals(list, _merge, retired={})
+# (cls, name) -> wrapper currently installed
+_installed = {}
+
+
+class _InstrumentedAttribute:
+    '''Wraps a descriptor that only defines __get__'''
+
+    def __init__(self, descriptor, owner, name, sample):
+        self.descriptor = descriptor
+        self.name = name
+        self.label = '{}.{}'.format(owner.__qualname__, name)
+        self.sample = sample
+        self._local = threading.local()
+        # Bound methods of the original, so the wrapper adds no frame
+        self._read = getattr(descriptor, '__get__', None) or self._read_dict
+        self._set = getattr(descriptor, '__set__', None)
+        self._delete = getattr(descriptor, '__delete__', None)
+
+    def _stats(self, operation):
+        '''Return this thread's counters for operation'''
+        stats = [0, 0, 0, 0]
+        setattr(self._local, operation, stats)
+        buffers = _totals.get()
+        with _totals.lock:
+            buffers.append((self.label, operation, stats))
+        return stats
+
+    def _timed(self, stats, method, *args):
+        start = perf_counter_ns()
+        try:
+            return method(*args)
+        finally:
+            elapsed = perf_counter_ns() - start
+            stats[1] += 1
+            stats[2] += elapsed
+            if elapsed > stats[3]:
+                stats[3] = elapsed
+
+    def _read_dict(self, instance, owner):
+        # A data descriptor without __get__: the value is in the
+        # instance __dict__ under the attribute name
+        if instance is None:
+            return self.descriptor
+        return instance.__dict__.get(self.name, self.descriptor)
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self._read(instance, owner)
+        try:
+            stats = self._local.get
+        except AttributeError:
+            stats = self._stats('get')
+        stats[0] += 1
+        if stats[0] % self.sample:
+            return self._read(instance, owner)
+        return self._timed(stats, self._read, instance, owner)
+
+
+class _InstrumentedDataAttribute(_InstrumentedAttribute):
+    '''Wraps a data descriptor, also counting sets and deletes'''
+
+    def __set__(self, instance, value):
+        try:
+            stats = self._local.set
+        except AttributeError:
+            stats = self._stats('set')
+        stats[0] += 1
+        if stats[0] % self.sample:
+            return self._set(instance, value)
+        return self._timed(stats, self._set, instance, value)
+
+    def __delete__(self, instance):
+        if self._delete is None:
+            raise AttributeError('__delete__')
+        try:
+            stats = self._local.delete
+        except AttributeError:
+            stats = self._stats('delete')
+        stats[0] += 1
+        if stats[0] % self.sample:
+            return self._delete(instance)
+        return self._timed(stats, self._delete, instance)
+
+
+def instrument(cls, name, sample=1):
+    '''
+    Count the accesses to cls.name and time one in `sample` of them.
+    cls must be the class that defines the attribute
+    '''
+    if sample < 1:
+        raise ValueError('sample must be >= 1')
+    try:
+        descriptor = cls.__dict__[name]
+    except KeyError:
+        raise AttributeError('{} does not define {!r}'.format(
+            cls.__qualname__, name)) from None
+    if isinstance(descriptor, _InstrumentedAttribute):
+        descriptor = descriptor.descriptor
+    if hasattr(type(descriptor), '__set__') or hasattr(
+            type(descriptor), '__delete__'):
+        wrapper = _InstrumentedDataAttribute(descriptor, cls, name, sample)
+    elif hasattr(type(descriptor), '__get__'):
+        wrapper = _InstrumentedAttribute(descriptor, cls, name, sample)
+    else:
+        raise TypeError('{}.{} is not a descriptor'.format(
+            cls.__qualname__, name))
+    setattr(cls, name, wrapper)
+    _installed[cls, name] = wrapper
+    return wrapper
+
+
+def uninstrument(cls, name):
+    '''Put the original descriptor back. The counters are kept'''
+    wrapper = _installed.pop((cls, name), None)
+    if wrapper is not None and cls.__dict__.get(name) is wrapper:
+        setattr(cls, name, wrapper.descriptor)
+
+
+def uninstrument_all():
+    for cls, name in list(_installed):
+        uninstrument(cls, name)
+
+
+def reset():
+    '''Forget all the counters collected so far'''
+    with _totals.lock:
+        for buffers in _totals.live.values():
+            for _, _, stats in buffers:
+                stats[:] = [0, 0, 0, 0]
+        _totals.retired.clear()
+
+
+def summary():
+    '''
+    Return one dict per attribute and operation, merged over threads and
+    sorted by estimated total time (mean sampled time * calls)
+    '''
+    merged = {}
+    with _totals.lock:
+        rows = [(label, operation, stats + [1])
+                for buffers in _totals.live.values()
+                for label, operation, stats in buffers]
+        rows.extend((label, operation, list(totals))
+                    for (label, operation), totals in _totals.retired.items())
+    for label, operation, (calls, sampled, total, longest, threads) in rows:
+        row = merged.setdefault((label, operation), {
+            'attribute': label, 'operation': operation, 'calls': 0,
+            'sampled': 0, 'total_ns': 0, 'max_ns': 0, 'threads': 0})
+        row['calls'] += calls
+        row['sampled'] += sampled
+        row['total_ns'] += total
+        row['max_ns'] = max(row['max_ns'], longest)
+        row['threads'] += threads
+    rows = []
+    for row in merged.values():
+        sampled = row.pop('sampled')
+        total = row.pop('total_ns')
+        row['mean_ns'] = total / sampled if sampled else 0.0
+        row['estimated_ms'] = row['mean_ns'] * row['calls'] / 1e6
+        rows.append(row)
+    rows.sort(key=lambda row: row['estimated_ms'], reverse=True)
+    return rows
+
+
+def report():
+    '''Return summary() as a table'''
+    lines = ['{:<28} {:<7} {:>10} {:>10} {:>10} {:>12} {:>7}'.format(
+        'attribute', 'op', 'calls', 'mean ns', 'max ns', 'est. ms', 'threads')]
+    for row in summary():
+        lines.append('{attribute:<28} {operation:<7} {calls:>10} '
+                     '{mean_ns:>10.1f} {max_ns:>10} {estimated_ms:>12.3f} '
+                     '{threads:>7}'.format(**row))
+    return '\n'.join(lines)
+
+
+def to_json(**kwargs):
+    return json.dumps(summary(), **kwargs)
+
+
+def benchmark(number=200000):
+    import timeit
+    from descriptors import Book
+
+    def per_call(statement):
+        best = min(timeit.repeat(statement, globals={'book': book},
+                                 number=number, repeat=5))
+        return best / number * 1e9
+
+    book = Book('William Faulkner', 'The Sound and the Fury', 12)
+    cases = [('off', None), ('sample=1', 1), ('sample=100', 100)]
+    print('{:>12} {:>10} {:>10}'.format('', 'get', 'set'))
+    for label, sample in cases:
+        if sample is not None:
+            instrument(Book, 'price', sample=sample)
+        get = per_call('book.price')
+        set_ = per_call('book.price = 13')
+        uninstrument(Book, 'price')
+        print('{:>12} {:>8.1f}ns {:>8.1f}ns'.format(label, get, set_))
+    reset()
+
+
+if __name__ == '__main__':
+    from descriptors import Book, Publisher
+
+    instrument(Book, 'price', sample=10)
+    instrument(Publisher, 'name')
+
+    def work():
+        book = Book('John Dos Passos', 'Manhattan Transfer', 13)
+        for i in range(10000):
+            book.price = i % 100
+            book.price
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    Publisher('Penguin').name
+    # >> getting name
+
+    print(report())
+    # >> attribute                    op           calls    mean ns ...
+    # >> Book.price                   set          40000 ...
+    print(to_json(indent=1)[:120])
+    uninstrument_all()
+    print(type(Book.__dict__['price']).__name__)
+    # >> Price2
+    print('-x-'*30)
+    benchmark()
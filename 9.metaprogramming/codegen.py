@@ -0,0 +1,103 @@
+from inspect import Parameter
+from types import CodeType
+
+"""
+Helpers for decorators that write their wrapper as source code.
+
+A wrapper built with def wrapper(*args, **kwargs) has to pack the
+arguments and, to look at one of them by name, bind them to the
+signature on every call. A generated wrapper takes exactly the
+parameters of the function it wraps, so each argument is already a
+local variable:
+
+    sig = signature(func)
+    params, call = signature_source(sig)
+    # params: 'a, b=_d_b, *args, c, **kwargs'
+    # call:   'a, b, *args, c=c, **kwargs'
+
+Defaults are referenced through names (_d_b above) that the caller
+puts in the namespace, so any default object works, and a wrapper can
+test `b is _d_b` to know that b was not passed.
+"""
+
+DEFAULT_PREFIX = '_d_'
+
+
+def default_name(name):
+    return DEFAULT_PREFIX + name
+
+
+def signature_source(sig):
+    """
+    Return (params, call) for sig: the source of an equivalent parameter
+    list without annotations, and of the arguments that pass every
+    parameter on to a function with the same signature
+    """
+    params = []
+    call = []
+    previous = None
+    for name, param in sig.parameters.items():
+        kind = param.kind
+        if previous is Parameter.POSITIONAL_ONLY and kind is not previous:
+            params.append('/')
+        if kind is Parameter.KEYWORD_ONLY and previous not in (
+                Parameter.KEYWORD_ONLY, Parameter.VAR_POSITIONAL):
+            params.append('*')
+        if kind is Parameter.VAR_POSITIONAL:
+            params.append('*' + name)
+            call.append('*' + name)
+        elif kind is Parameter.VAR_KEYWORD:
+            params.append('**' + name)
+            call.append('**' + name)
+        else:
+            if param.default is Parameter.empty:
+                params.append(name)
+            else:
+                params.append('{}={}'.format(name, default_name(name)))
+            if kind is Parameter.KEYWORD_ONLY:
+                call.append('{0}={0}'.format(name))
+            else:
+                call.append(name)
+        previous = kind
+    if previous is Parameter.POSITIONAL_ONLY:
+        params.append('/')
+    return ', '.join(params), ', '.join(call)
+
+
+def defaults(sig):
+    """Return {default_name(name): default} for the parameters of sig"""
+    return {default_name(name): param.default
+            for name, param in sig.parameters.items()
+            if param.default is not Parameter.empty}
+
+
+_GENERATED = '_generated'
+
+
+def make_function(name, params, body, namespace, filename='<generated>'):
+    """
+    Compile `def name(params):` followed by the lines of body in
+    namespace and return the function. A parameter may not share a name
+    with an entry of namespace that the body uses. name needn't be an
+    identifier (a lambda's is '<lambda>'): the def uses a fixed one and
+    the function and its code are renamed after
+    """
+    source = 'def {}({}):\n{}'.format(
+        _GENERATED, params, ''.join('    {}\n'.format(line) for line in body))
+    module_code = compile(source, filename, 'exec')
+    function_code = next(const for const in module_code.co_consts
+                         if isinstance(const, CodeType))
+    # A parameter or local with the name of a global would hide it
+    clashes = set(function_code.co_varnames) & set(namespace)
+    if clashes:
+        raise ValueError('parameter names clash with generated names: '
+                         '{}'.format(', '.join(sorted(clashes))))
+    exec(module_code, namespace)
+    function = namespace.pop(_GENERATED)
+    code = function.__code__.replace(co_name=name)
+    if hasattr(code, 'co_qualname'):
+        code = code.replace(co_qualname=name)
+    function.__code__ = code
+    function.__name__ = function.__qualname__ = name
+    function.__source__ = source
+    return function
@@ -10,37 +10,40 @@ import time
 from functools import wraps
 from inspect import signature, Parameter
 
+from memoize import memoize
+from timing_registry import registry
 
-def timethis(func):
-    results = dict()
+
+def timethis(func=None, *, maxsize=128, ttl=None):
+    # The results used to go in a plain dict: it grew without limit,
+    # stored a result even with cache=False and took a falsy result
+    # such as 0 for a miss. memoize bounds it and keys on kwargs too
+    if func is None:
+        return lambda func: timethis(func, maxsize=maxsize, ttl=ttl)
     sig = signature(func)
     if 'cache' in sig.parameters:
         raise TypeError('{} already has {} as parameter'.format(
             func.__qualname__,
             'cache'
         ))
+    cached_func = memoize(func, maxsize=maxsize, ttl=ttl)
+    name = '{}.{}'.format(func.__module__, func.__qualname__)
 
     @wraps(func)
     def wrapper(*args, cache=False, **kwargs):
-        nonlocal results
-        start = time.time()
-        if cache is True:
-            cached = results.get(args)
-            if not cached:
-                rv = func(*args, **kwargs)
-                results[args] = rv
-            else:
-                rv = cached
-        else:
-            rv = func(*args, **kwargs)
-            results[args] = rv
-        end = time.time()
-        seconds = end - start
-        seconds = "{:10.9f}".format(seconds)
-        print("Operation took %s seconds" % seconds)
-        return rv
+        # The duration goes in the latency histogram of timing_registry
+        # instead of being printed on every call
+        start = time.perf_counter_ns()
+        try:
+            if cache is True:
+                return cached_func(*args, **kwargs)
+            return func(*args, **kwargs)
+        finally:
+            registry.record(name, time.perf_counter_ns() - start)
+    wrapper.cache_info = cached_func.cache_info
+    wrapper.cache_clear = cached_func.cache_clear
     parms = list(sig.parameters.values())
-    parms.append(Parameter('debug',
+    parms.append(Parameter('cache',
                            Parameter.KEYWORD_ONLY,
                            default=False))
     wrapper.__signature__ = sig.replace(parameters=parms)
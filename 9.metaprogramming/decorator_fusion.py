@@ -0,0 +1,322 @@
+import ast
+from collections import namedtuple
+from functools import WRAPPER_ASSIGNMENTS
+from inspect import signature
+import unittest
+
+from codegen import defaults, make_function, signature_source
+
+"""
+@timeit
+@typeassert(int, int)
+@loggedv1(logging.INFO)
+@profiler
+def add(a, b):
+    return a + b
+
+calls four wrappers before add, each one packing the arguments into
+*args, **kwargs and unpacking them again. Put @fuse on top:
+
+@fuse
+@timeit
+...
+
+and the stack is replaced by one wrapper, generated with the parameters
+of add, doing what the four did in the same order:
+
+    def add(a, b):
+        _0_start = _0_now()
+        try:
+            if not _1_isinstance(a, _1_t_a): raise _1_TypeError(_1_m_a)
+            ...
+            if _2_log.enabled is not False: _2_log()
+            _3_frame = _3_enter(_3_key)
+            try:
+                return _func(a, b)
+            finally:
+                _3_exit(_3_key, _3_frame)
+        finally:
+            _0_record(_0_name, _0_now() - _0_start)
+
+A decorator cooperates by setting wrapper.__fuse__ to the Hooks its
+wrapper runs around the call of wrapper.__wrapped__: lines of source
+run before it, lines run after it (in a finally), the globals they use,
+the local variables they set, and the names of the accessors it puts on
+the wrapper (set_level, ncalls, ...). The variables are prefixed with
+the position of the decorator, so two decorators can use the same ones.
+fuse() unwraps decorators while they have __fuse__; the first one
+without it (or the function itself) is what the fused wrapper calls.
+The fused wrapper gets the accessors the decorators list, and nothing
+else of their __dict__.
+
+timethis is not fusable: it adds a cache parameter, so its wrapper does
+not call __wrapped__ with its own arguments. debug has no wrapper, it
+swaps the code of the function itself, and is left as it is.
+"""
+
+Hooks = namedtuple('Hooks', 'before after namespace locals accessors',
+                   defaults=((), (), {}, (), ()))
+
+
+def _renamed(lines, names, prefix):
+    '''
+    Return lines with prefix put before the variables in names. Only the
+    names the code reads or sets are renamed, not attributes or strings
+    '''
+    names = set(names)
+    lines = [line.encode() for line in lines]
+    if not names or not lines:
+        return [line.decode() for line in lines]
+    tree = ast.parse(b'\n'.join(lines))
+    # col_offset counts bytes, from the end so the offsets stay valid
+    positions = sorted(((node.lineno - 1, node.col_offset)
+                        for node in ast.walk(tree)
+                        if isinstance(node, ast.Name) and node.id in names),
+                       reverse=True)
+    for row, offset in positions:
+        line = lines[row]
+        lines[row] = line[:offset] + prefix.encode() + line[offset:]
+    return [line.decode() for line in lines]
+
+
+def _fusable(func):
+    hooks = getattr(func, '__fuse__', None)
+    # functools.wraps copies the __dict__ of the wrapped function, so a
+    # decorator that doesn't cooperate shows the __fuse__ of the one below
+    return hooks is not None and hooks is not getattr(
+        func.__wrapped__, '__fuse__', None)
+
+
+def _layers(func):
+    '''Return ([Hooks of the outermost decorator first], called function)'''
+    layers = []
+    while _fusable(func):
+        layers.append(func.__fuse__)
+        func = func.__wrapped__
+    return layers, func
+
+
+def fuse(func):
+    '''Replace the cooperating decorators on top of func by one wrapper'''
+    layers, target = _layers(func)
+    if not layers:
+        return func
+    sig = signature(func)
+    namespace = {'_func': target}
+    namespace.update(defaults(sig))
+    params, call = signature_source(sig)
+
+    body = []
+    finals = []
+    indent = ''
+    for position, hooks in enumerate(layers):
+        prefix = '_{}'.format(position)
+        names = list(hooks.namespace) + list(hooks.locals)
+        namespace.update((prefix + name, value)
+                         for name, value in hooks.namespace.items())
+        body.extend(indent + line
+                    for line in _renamed(hooks.before, names, prefix))
+        if hooks.after:
+            body.append(indent + 'try:')
+            finals.append((indent, _renamed(hooks.after, names, prefix)))
+            indent += '    '
+    body.append(indent + 'return _func({})'.format(call))
+    for indent, after in reversed(finals):
+        body.append(indent + 'finally:')
+        body.extend(indent + '    ' + line for line in after)
+
+    fused = make_function(target.__name__, params, body, namespace,
+                          '<fused {}>'.format(target.__qualname__))
+    for attr in WRAPPER_ASSIGNMENTS:
+        try:
+            setattr(fused, attr, getattr(func, attr))
+        except AttributeError:
+            pass
+    stack = [func]
+    while stack[-1] is not target:
+        stack.append(stack[-1].__wrapped__)
+    # the outer ones last, as a stack would show them
+    for wrapper, hooks in reversed(list(zip(stack, layers))):
+        for name in hooks.accessors:
+            setattr(fused, name, getattr(wrapper, name))
+    fused.__wrapped__ = target
+    fused.__signature__ = sig
+    fused.__fused__ = tuple(stack[:-1])
+    return fused
+
+
+def _public(func):
+    return {name: value for name, value in vars(func).items()
+            if not name.startswith('_')}
+
+
+class TestFuse(unittest.TestCase):
+
+    def stacks(self):
+        '''
+        Yield the same stack of decorators twice, on two functions, and
+        how to read the number of profiled calls of one of them
+        '''
+        import logging
+        from decorator_with_accessors import loggedv2
+        from decorators_as_class import Profiled, profiler
+        from simple_decorator import timeit
+        from typeassert_decorator import typeassert
+
+        def with_profiler():
+            @timeit
+            @typeassert(int, int)
+            @loggedv2(logging.DEBUG, 'fusion.test')
+            @profiler
+            def add(a, b):
+                '''Add two ints'''
+                return a + b
+            return add
+
+        def with_profiled():
+            @timeit
+            @loggedv2(logging.DEBUG, 'fusion.test')
+            @typeassert(int, b=int)
+            @Profiled
+            def add(a, b=1):
+                '''Add two ints'''
+                return a + b
+            return add
+
+        def profiled_calls(func):
+            # Profiled's ncalls is an int, the decorators above it hold
+            # copies: read it on the Profiled wrapper, right above add
+            layer = getattr(func, '__fused__', (func,))[-1]
+            while hasattr(layer.__wrapped__, '__wrapped__'):
+                layer = layer.__wrapped__
+            return layer.ncalls
+
+        logging.getLogger('fusion.test').setLevel(logging.WARNING)
+        for make, ncalls in ((with_profiler, lambda func: func.ncalls()),
+                             (with_profiled, profiled_calls)):
+            yield make(), fuse(make()), ncalls
+
+    def test_same_api_and_results(self):
+        for stacked, fused, ncalls in self.stacks():
+            self.assertEqual(sorted(_public(fused)), sorted(_public(stacked)))
+            self.assertEqual(sorted(_public(fused)),
+                             ['get_level', 'get_message', 'ncalls',
+                              'set_level', 'set_message'])
+            for attr in ('__name__', '__qualname__', '__doc__'):
+                self.assertEqual(getattr(fused, attr), getattr(stacked, attr))
+            self.assertEqual(signature(fused), signature(stacked))
+            for func in (stacked, fused):
+                calls = ncalls(func)
+                self.assertEqual(func(2, 3), 5)
+                self.assertEqual(func(a=2, b=3), 5)
+                self.assertRaises(TypeError, func, 2, 'three')
+                self.assertEqual(ncalls(func), calls + 2)
+                func.set_message('Adding')
+                self.assertEqual(func.get_message(), 'Adding')
+
+    def test_renamed_leaves_attributes_and_strings(self):
+        lines = ['if _log.enabled: _log(_log.name, "_log")',
+                 'for _x in _log: _name = _x']
+        self.assertEqual(_renamed(lines, ['_log', '_x', 'name'], '_0'),
+                         ['if _0_log.enabled: _0_log(_0_log.name, "_log")',
+                          'for _0_x in _0_log: _name = _0_x'])
+
+    def test_lambda(self):
+        # '<lambda>' is not an identifier, the generated defs can't use it
+        from decorators_as_class import profiler
+        from typeassert_decorator import typeassert
+
+        fused = fuse(typeassert(int)(profiler(lambda x: x + 1)))
+        self.assertEqual(fused(1), 2)
+        self.assertRaises(TypeError, fused, 'one')
+        self.assertEqual(fused.__name__, '<lambda>')
+
+    def test_stops_at_a_decorator_that_does_not_cooperate(self):
+        from functools import wraps
+        from decorators_as_class import profiler
+
+        def plain(func):
+            @wraps(func)
+            def wrapper(*args, **kwargs):
+                return func(*args, **kwargs) + 1
+            return wrapper
+
+        @profiler
+        @plain
+        @profiler
+        def add(a, b):
+            return a + b
+
+        fused = fuse(add)
+        self.assertEqual(fused(2, 3), 6)
+        self.assertEqual(len(fused.__fused__), 1)
+        self.assertIs(fused.__wrapped__, add.__wrapped__)
+
+
+def benchmark(number=200000):
+    import logging
+    import timeit
+
+    from decorator_with_arguments import loggedv1
+    from decorators_as_class import profiler
+    from simple_decorator import timeit as timed
+    from typeassert_decorator import typeassert
+
+    def stacked():
+        @timed
+        @typeassert(int, int)
+        @loggedv1(logging.DEBUG, 'fusion.benchmark')
+        @profiler
+        def add(a, b):
+            return a + b
+        return add
+
+    def add(a, b):
+        return a + b
+
+    logging.getLogger('fusion.benchmark').setLevel(logging.WARNING)
+    cases = [('undecorated', add), ('stacked', stacked()),
+             ('fused', fuse(stacked()))]
+    base = None
+    for label, func in cases:
+        best = min(timeit.repeat(lambda: func(2, 3), number=number,
+                                 repeat=5)) / number * 1e9
+        base = base or best
+        print('{:>12}: {:7.1f}ns per call, +{:.1f}ns'.format(
+            label, best, best - base))
+
+
+if __name__ == '__main__':
+    import logging
+
+    from decorator_with_accessors import loggedv2
+    from decorators_as_class import profiler
+    from simple_decorator import timeit
+    from timing_registry import registry
+    from typeassert_decorator import typeassert
+
+    @fuse
+    @timeit
+    @typeassert(int, int)
+    @loggedv2(logging.INFO, 'fusion', 'Adding')
+    @profiler
+    def add(a, b):
+        '''Add two ints'''
+        return a + b
+
+    print(add(2, 3), add.__doc__, signature(add))
+    # >> 5 Add two ints (a, b)
+    try:
+        add(2, 'three')
+    except TypeError as e:
+        print(e)
+    # >> Argument b must be of type <class 'int'>
+    add.set_level(logging.DEBUG)
+    print(add.__wrapped__.__name__, len(add.__fused__))
+    # >> add 4
+    print(add.ncalls(), registry.snapshot()['__main__.add']['count'])
+    # >> 1 2
+    print(add.__source__)
+    print('-x-'*30)
+    benchmark()
+    unittest.main()
@@ -1,3 +1,10 @@
+from collections import deque
+from inspect import signature
+from time import perf_counter_ns
+
+from codegen import defaults, make_function, signature_source
+
+
 def logger(cls):
     orig_attr = cls.__getattribute__
 
@@ -39,3 +46,248 @@ class A(LoggedGetattribute):
 
     def spam(self):
         pass
+
+
+# logger and LoggedGetattribute above replace __getattribute__, so every
+# attribute access of every instance (methods and dunders included)
+# goes through a Python function and a print. traced is the version to
+# leave on:
+#
+#     @traced('age', 'setage', sample=10)
+#     class Student: ...
+#
+# Only the named attributes are replaced, each by a descriptor (or, for
+# a method, a wrapper function) written for that attribute. Every other
+# attribute, and every class that is not traced, is left untouched. An
+# event (perf_counter_ns(), operation, 'Student.age', id(instance)) is
+# appended to a ring buffer, a deque with a maxlen, instead of printed:
+# one event in `sample` accesses of the attribute. untrace(cls) puts the
+# original attributes back.
+
+events = deque(maxlen=10000)
+_MISSING = object()
+
+_RECORD = "_append((_now(), {op!r}, _label, _id({target})))"
+_SAMPLED_RECORD = '''_counter[0] += 1
+if not _counter[0] % _sample:
+    _append((_now(), {op!r}, _label, _id({target})))'''
+
+# A plain instance attribute, with an optional default on the class
+_ATTRIBUTE_TEMPLATE = """\
+class {classname}:
+    def __get__(self, instance, owner):
+        if instance is None:
+            return self if _default is _MISSING else _default
+        value = instance.__dict__.get(_name, _default)
+        if value is _MISSING:
+            raise AttributeError(_name)
+{record_get}
+        return value
+
+    def __set__(self, instance, value):
+        instance.__dict__[_name] = value
+{record_set}
+
+    def __delete__(self, instance):
+        try:
+            del instance.__dict__[_name]
+        except KeyError:
+            raise AttributeError(_name) from None
+{record_delete}
+"""
+
+# A descriptor defined on the class, such as a property
+_DESCRIPTOR_TEMPLATE = """\
+class {classname}:
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return _get(instance, owner)
+        value = _get(instance, owner)
+{record_get}
+        return value
+"""
+_DESCRIPTOR_SET = """
+    def __set__(self, instance, value):
+        _set(instance, value)
+{record_set}
+"""
+_DESCRIPTOR_DELETE = """
+    def __delete__(self, instance):
+        _delete(instance)
+{record_delete}
+"""
+
+
+def _indent(source, spaces):
+    return ''.join(' ' * spaces + line + '\n' for line in source.splitlines())
+
+
+def _record(op, sample, spaces, target='instance'):
+    source = _SAMPLED_RECORD if sample > 1 else _RECORD
+    return _indent(source.format(op=op, target=target), spaces).rstrip('\n')
+
+
+def _traced_function(func, namespace, sample):
+    sig = signature(func)
+    params, call = signature_source(sig)
+    first = next(iter(sig.parameters), None)
+    if first is None or sig.parameters[first].kind not in (
+            sig.parameters[first].POSITIONAL_ONLY,
+            sig.parameters[first].POSITIONAL_OR_KEYWORD):
+        raise TypeError('{} does not take the instance as its first '
+                        'parameter'.format(func.__qualname__))
+    namespace['_func'] = func
+    namespace.update(defaults(sig))
+    body = _record('call', sample, 0, target=first).splitlines()
+    body.append('return _func({})'.format(call))
+    wrapper = make_function(func.__name__, params, body, namespace,
+                            '<traced {}>'.format(func.__qualname__))
+    wrapper.__wrapped__ = func
+    wrapper.__doc__ = func.__doc__
+    wrapper.__qualname__ = func.__qualname__
+    wrapper.__module__ = func.__module__
+    return wrapper
+
+
+def _traced_attribute(cls, name, sample, buffer):
+    original = _MISSING
+    for klass in cls.__mro__:
+        if name in klass.__dict__:
+            original = klass.__dict__[name]
+            break
+    label = '{}.{}'.format(cls.__qualname__, name)
+    namespace = {'_append': buffer.append, '_now': perf_counter_ns,
+                 '_id': id, '_label': label, '_name': name,
+                 '_sample': sample, '_counter': [0], '_MISSING': _MISSING}
+    if callable(original) and hasattr(original, '__code__'):
+        return _traced_function(original, namespace, sample)
+
+    records = {'record_' + op: _record(op, sample, 8)
+               for op in ('get', 'set', 'delete')}
+    kind = type(original)
+    if original is not _MISSING and hasattr(kind, '__get__'):
+        namespace['_get'] = original.__get__
+        source = _DESCRIPTOR_TEMPLATE
+        if hasattr(kind, '__set__'):
+            namespace['_set'] = original.__set__
+            source += _DESCRIPTOR_SET
+        if hasattr(kind, '__delete__'):
+            namespace['_delete'] = original.__delete__
+            source += _DESCRIPTOR_DELETE
+    else:
+        namespace['_default'] = original
+        source = _ATTRIBUTE_TEMPLATE
+    classname = 'Traced_' + name
+    source = source.format(classname=classname, **records)
+    exec(source, namespace)
+    descriptor = namespace[classname]()
+    descriptor.__source__ = source
+    return descriptor
+
+
+def traced(*names, sample=1, buffer=None):
+    '''
+    Class decorator recording accesses to the given attributes of its
+    instances (gets, sets and deletes, or calls for methods) in buffer,
+    a deque with a maxlen that defaults to the module's `events`
+    '''
+    if sample < 1:
+        raise ValueError('sample must be >= 1')
+    if buffer is None:
+        buffer = events
+
+    def decorate(cls):
+        originals = cls.__dict__.get('__traced__', {})
+        for name in names:
+            if name not in originals:
+                originals[name] = cls.__dict__.get(name, _MISSING)
+            setattr(cls, name, _traced_attribute(cls, name, sample, buffer))
+        cls.__traced__ = originals
+        return cls
+    return decorate
+
+
+def untrace(cls):
+    '''Put back the attributes traced replaced'''
+    for name, original in cls.__dict__.get('__traced__', {}).items():
+        if original is _MISSING:
+            delattr(cls, name)
+        else:
+            setattr(cls, name, original)
+    if '__traced__' in cls.__dict__:
+        del cls.__traced__
+
+
+@traced('age', 'setage', sample=1)
+class TracedStudent:
+    age = None
+
+    def __init__(self, name):
+        self.name = name
+
+    def getage(self):
+        return self.age
+
+    def setage(self, a):
+        self.age = a
+
+
+def benchmark(number=1000000):
+    import contextlib
+    import io
+    import timeit
+
+    class Plain:
+        age = None
+
+        def __init__(self, name):
+            self.name = name
+
+        def getage(self):
+            return self.age
+
+    @logger
+    class Printing(Plain):
+        pass
+
+    @traced('age', buffer=deque(maxlen=1024))
+    class Traced(Plain):
+        pass
+
+    @traced('age', sample=100, buffer=deque(maxlen=1024))
+    class Sampled(Plain):
+        pass
+
+    def per_call(stmt, number=number):
+        best = min(timeit.repeat(stmt, number=number, repeat=5))
+        return best / number * 1e9
+
+    printing = Printing('x')
+    with contextlib.redirect_stdout(io.StringIO()):
+        best = per_call(lambda: printing.name, number // 10)
+    print('{:>24}: {:6.1f}ns'.format('logger, s.name', best))
+    for cls in (Plain, Traced, Sampled):
+        s = cls('x')
+        s.age = 20
+        print('{:>24}: {:6.1f}ns'.format(cls.__name__ + ', s.name',
+                                        per_call(lambda: s.name)))
+        print('{:>24}: {:6.1f}ns'.format(cls.__name__ + ', s.age',
+                                        per_call(lambda: s.age)))
+
+
+if __name__ == '__main__':
+    s = TracedStudent('Aman')
+    s.setage(20)
+    s.getage()
+    s.name
+    for event in events:
+        print(event[1:3])
+    # >> ('call', 'TracedStudent.setage')
+    # >> ('set', 'TracedStudent.age')
+    # >> ('get', 'TracedStudent.age')
+    untrace(TracedStudent)
+    s.getage()
+    print(len(events))
+    # >> 3
+    print('-x-'*30)
+    benchmark()
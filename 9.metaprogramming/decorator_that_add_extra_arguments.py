@@ -1,20 +1,58 @@
 from functools import wraps
 import inspect
 
+from codegen import defaults, make_function, signature_source
+
+# The wrapper used to be wrapper(*args, debug=False, **kwargs): every
+# call, debug or not, packed and unpacked the arguments. It is now
+# generated with the parameters of func plus the keyword-only debug,
+#
+#     def add(a, b, *, debug=_d_debug):
+#         if debug: _print('Calling', _name)
+#         return _func(a, b)
+#
+# and inspect.signature() replaces inspect.getargspec(), which Python
+# 3.11 removed.
+
 
 def optional_debug(func):
-    if 'debug' in inspect.getargspec(func).args:
+    sig = inspect.signature(func)
+    if 'debug' in sig.parameters:
         raise TypeError('debug argument already defined')
 
-    @wraps(func)
-    def wrapper(*args, debug=False, **kwargs):
-        if debug:
-            print('Calling', func.__name__)
-        return func(*args, **kwargs)
-    sig = inspect.signature(func)
     parms = list(sig.parameters.values())
-    parms.append(inspect.Parameter('debug',
-                                   inspect.Parameter.KEYWORD_ONLY,
-                                   default=False))
-    wrapper.__signature__ = sig.replace(parameters=parms)
+    debug = inspect.Parameter('debug', inspect.Parameter.KEYWORD_ONLY,
+                              default=False)
+    # keyword-only parameters go before **kwargs
+    if parms and parms[-1].kind is inspect.Parameter.VAR_KEYWORD:
+        parms.insert(-1, debug)
+    else:
+        parms.append(debug)
+    new_sig = sig.replace(parameters=parms)
+
+    params, _ = signature_source(new_sig)
+    _, call = signature_source(sig)
+    namespace = {'_func': func, '_print': print, '_name': func.__name__}
+    namespace.update(defaults(new_sig))
+    body = ["if debug: _print('Calling', _name)",
+            'return _func({})'.format(call)]
+    wrapper = make_function(func.__name__, params, body, namespace,
+                            '<optional_debug {}>'.format(func.__qualname__))
+    wrapper = wraps(func)(wrapper)
+    wrapper.__signature__ = new_sig
     return wrapper
+
+
+if __name__ == '__main__':
+
+    @optional_debug
+    def spam(a, b, c, **kwargs):
+        print(a, b, c)
+
+    spam(1, 2, 3)
+    # >> 1 2 3
+    spam(1, 2, 3, debug=True)
+    # >> Calling spam
+    # >> 1 2 3
+    print(inspect.signature(spam))
+    # >> (a, b, c, *, debug=False, **kwargs)
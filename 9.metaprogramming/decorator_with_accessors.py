@@ -2,6 +2,9 @@ from functools import wraps, partial
 import logging
 import unittest
 
+from decorator_fusion import Hooks
+from queued_logging import LogCall
+
 """
 @decorator(x, y, z)
 def func(a, b):
@@ -22,27 +25,38 @@ def attach_to_wrapper(obj, func=None):
     return func
 
 
-def loggedv2(level, name=None, message=None):
+def loggedv2(level, name=None, message=None, sample=1, rate=None):
 
     def decorate(func):
         logname = name if name else func.__module__
         logger = logging.getLogger(name=logname)
         logmessage = message if message else func.__name__
+        # the record is handled on a background thread, see queued_logging
+        log = LogCall(logger, level, logmessage, func, sample, rate)
 
         @wraps(func)
         def wrapper(*args, **kwargs):
-            logger.log(level, msg=logmessage)
+            if log.enabled is not False:
+                log()
             return func(*args, **kwargs)
+        # see decorator_fusion
+        wrapper.__fuse__ = Hooks(
+            before=['if _log.enabled is not False: _log()'],
+            namespace={'_log': log},
+            accessors=['set_level', 'set_message', 'get_level',
+                       'get_message'])
 
         @attach_to_wrapper(wrapper)
         def set_level(newlevel):
             nonlocal level
             level = newlevel
+            log.set_level(newlevel)
 
         @attach_to_wrapper(wrapper)
         def set_message(newmsg):
             nonlocal logmessage
             logmessage = newmsg
+            log.message = newmsg
 
         @attach_to_wrapper(wrapper)
         def get_level():
@@ -50,7 +64,7 @@ def loggedv2(level, name=None, message=None):
 
         @attach_to_wrapper(wrapper)
         def get_message():
-            return message
+            return logmessage
 
         return wrapper
     return decorate
@@ -80,7 +94,7 @@ class TestAccessorDecorator(unittest.TestCase):
         multiply(2, 3)
         multiply.set_message('Multiply called')
         multiply(4, 5)
-        assert multiply.get_message(), 'Multiply called'
+        self.assertEqual(multiply.get_message(), 'Multiply called')
 
 
 if __name__ == '__main__':
@@ -2,6 +2,9 @@ from functools import wraps
 import logging
 import unittest
 
+from decorator_fusion import Hooks
+from queued_logging import LogCall
+
 """
 @decorator(x, y, z)
 def func(a, b):
@@ -14,12 +17,13 @@ def func(a, b):
 func = decorator(x, y, z)(func)
 """
 
-def loggedv1(level, name=None, message=None):
+def loggedv1(level, name=None, message=None, sample=1, rate=None):
     """
     Decorator to record logs based on user provided
     nam and message. If name is not provided the module
     will be used. If message is not provided the func
-    name will be used
+    name will be used. sample=N logs one call in N,
+    rate=N at most N calls per second
     """
 
     def decorator(func):
@@ -32,15 +36,22 @@ def loggedv1(level, name=None, message=None):
         logger = logging.getLogger(name=logname)
         # collect the log message
         logmessage = message if message else func.__name__
+        # the record is handled on a background thread, see queued_logging
+        log = LogCall(logger, level, logmessage, func, sample, rate)
 
         @wraps(func)
         def wrapper(*args, **kwargs):
             """ wrapper that executes the original
             function inside its control flow
             and utilizes the functions args """
-            # log the message
-            logger.log(level, msg=logmessage)
+            # log the message, unless the level is known to be disabled
+            if log.enabled is not False:
+                log()
             return func(*args, **kwargs)
+        # see decorator_fusion
+        wrapper.__fuse__ = Hooks(
+            before=['if _log.enabled is not False: _log()'],
+            namespace={'_log': log})
         return wrapper
     return decorator
 
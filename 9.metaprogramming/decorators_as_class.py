@@ -1,48 +1,234 @@
 # Good article
 # http://www.ianbicking.org/blog/2008/10/decorators-and-descriptors.html
 
+# Profiled and profiler record, for every decorated function, the number
+# of calls, the inclusive time (with the profiled functions it calls)
+# and the exclusive time (without them), plus caller -> callee edges and
+# the time spent in each stack of profiled calls.
+#
+# Every thread records into its own _ThreadStats, so a call touches no
+# shared counter and takes no lock. stats(), call_graph() and
+# folded_stacks() merge all the threads when they are read. When a thread
+# exits its counters are added to shared totals and its _ThreadStats is
+# dropped, so a pool that keeps replacing threads does not grow them.
+# folded_stacks() is the "a;b;c 1234" format that flamegraph.pl,
+# speedscope and most flame graph tools read.
+
+import threading
 import types
+import unittest
 from functools import wraps
+from time import perf_counter_ns
 
+from decorator_fusion import Hooks
+from thread_totals import ThreadTotals
 
-class Profiled:
+
+class _Key:
+    '''
+    What the counters of one wrapper are kept under. Two functions with
+    the same module and qualname, e.g. two closures made by the same
+    function, get their own counters; the label is only what the
+    reports show
+    '''
+    __slots__ = ('label',)
 
     def __init__(self, func):
-        # dont understand this
-        wraps(func)(self)
-        self.ncalls = 0
-        self.func = func
-
-    def __call__(self, *args, **kwargs):
-        self.ncalls += 1
-        return self.__wrapped__(*args, **kwargs)
-        # return self.func(*args, **kwargs)
-
-    def __get__(self, instance, owner):
-        """
-        This is only required for the situations when the decorator Profiled
-        needs to be applied on class instances.
-        Also, it is required because the invocation of class methods
-        triggers the invocation of the __get__ method as part of the descriptor
-        protocol
-        """
-        if instance is None:
-            return self
-        else:
-            print("here....")
-            return types.MethodType(self, instance)
+        self.label = '{}.{}'.format(func.__module__, func.__qualname__)
+
+    def __repr__(self):
+        return '<_Key {}>'.format(self.label)
+
+
+class _ThreadStats:
+    __slots__ = ('thread', 'stack', 'depth', 'paths', 'calls', 'edges',
+                 'folded')
+
+    def __init__(self):
+        self.thread = threading.current_thread().name
+        # one [path, time spent in profiled callees, ...] per active call
+        self.stack = []
+        # key -> number of its calls on the stack
+        self.depth = {}
+        # path -> {key: path + (key,)}, so a call finds its path
+        # without building a tuple
+        self.paths = {(): {}}
+        # key -> [calls, inclusive ns, exclusive ns]
+        self.calls = {}
+        # (caller, callee) -> calls, caller is None at the top level
+        self.edges = {}
+        # path of keys -> exclusive ns
+        self.folded = {}
+
+
+def _merge(totals, state):
+    '''Add the counters of an exited thread to totals'''
+    for key, counters in state.calls.items():
+        total = totals.calls.setdefault(key, [0, 0, 0])
+        for i, value in enumerate(counters):
+            total[i] += value
+    for edge, calls in state.edges.items():
+        totals.edges[edge] = totals.edges.get(edge, 0) + calls
+    for path, ns in state.folded.items():
+        totals.folded[path] = totals.folded.get(path, 0) + ns
+
+
+_totals = ThreadTotals(_ThreadStats, _merge)
+_local = _totals.local
+
+
+def _enter(key):
+    try:
+        state = _local.state
+    except AttributeError:
+        state = _totals.get()
+    stack = state.stack
+    if stack:
+        parent = stack[-1]
+        parent_path = parent[0]
+    else:
+        parent = None
+        parent_path = ()
+    children = state.paths[parent_path]
+    path = children.get(key)
+    if path is None:
+        path = children[key] = parent_path + (key,)
+        state.paths[path] = {}
+    depth = state.depth
+    depth[key] = depth.get(key, 0) + 1
+    # [path, time spent in profiled callees, parent, stats, start]
+    frame = [path, 0, parent, state, 0]
+    stack.append(frame)
+    frame[4] = perf_counter_ns()
+    return frame
+
+
+def _exit(key, frame):
+    elapsed = perf_counter_ns() - frame[4]
+    path, callees, parent, state, _ = frame
+    state.stack.pop()
+    depth = state.depth[key] - 1
+    state.depth[key] = depth
+    exclusive = elapsed - callees
+    counters = state.calls.get(key)
+    if counters is None:
+        counters = state.calls[key] = [0, 0, 0]
+    counters[0] += 1
+    # A recursive call is already inside the outermost one's time
+    if not depth:
+        counters[1] += elapsed
+    counters[2] += exclusive
+    edge = (parent[0][-1] if parent else None, key)
+    state.edges[edge] = state.edges.get(edge, 0) + 1
+    state.folded[path] = state.folded.get(path, 0) + exclusive
+    if parent is not None:
+        parent[1] += elapsed
+
+
+def _profiled_call(key, func, args, kwargs):
+    frame = _enter(key)
+    try:
+        return func(*args, **kwargs)
+    finally:
+        _exit(key, frame)
+
+
+# What a profiled wrapper does around the call, for decorator_fusion
+def _hooks(key, before=(), namespace=()):
+    return Hooks(before=list(before) + ['_frame = _enter(_key)'],
+                 after=['_exit(_key, _frame)'],
+                 namespace=dict(namespace, _enter=_enter, _exit=_exit,
+                                _key=key),
+                 locals=['_frame'],
+                 accessors=['ncalls'])
+
+
+def _ncalls(key):
+    def ncalls():
+        return sum(state.calls.get(key, (0,))[0]
+                   for state in _totals.states())
+    return ncalls
+
+
+def stats():
+    '''Return {label: {calls, inclusive_ns, exclusive_ns}} over all threads'''
+    merged = {}
+    for state in _totals.states():
+        for key, counters in list(state.calls.items()):
+            total = merged.setdefault(key.label, [0, 0, 0])
+            for i, value in enumerate(counters):
+                total[i] += value
+    return {label: {'calls': calls, 'inclusive_ns': inclusive,
+                    'exclusive_ns': exclusive}
+            for label, (calls, inclusive, exclusive) in merged.items()}
+
+
+def call_graph():
+    '''Return {(caller, callee): calls}, caller None for top level calls'''
+    merged = {}
+    for state in _totals.states():
+        for (caller, callee), calls in list(state.edges.items()):
+            edge = (caller and caller.label, callee.label)
+            merged[edge] = merged.get(edge, 0) + calls
+    return merged
+
+
+def folded_stacks():
+    '''Return the profile as folded stacks, one "a;b;c <ns>" per line'''
+    merged = {}
+    for state in _totals.states():
+        for path, ns in list(state.folded.items()):
+            stack = ';'.join(key.label for key in path)
+            merged[stack] = merged.get(stack, 0) + ns
+    return '\n'.join('{} {}'.format(stack, ns)
+                     for stack, ns in sorted(merged.items()))
+
+
+def export_folded(path):
+    with open(path, 'w') as f:
+        f.write(folded_stacks() + '\n')
+
+
+def reset():
+    '''Forget what every thread recorded. Calls in progress still finish'''
+    with _totals.lock:
+        for state in [_totals.retired] + list(_totals.live.values()):
+            state.calls.clear()
+            state.edges.clear()
+            state.folded.clear()
+
+
+class Profiled:
+    '''
+    The class version of profiler, with ncalls an int attribute.
+    Profiled(func) returns a plain function rather than a Profiled
+    instance: CPython calls a function found on a class as a method
+    without building a bound method, an object with __get__ had to
+    return a new MethodType on every access
+    '''
+
+    def __new__(cls, func):
+        key = _Key(func)
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            wrapper.ncalls += 1
+            return _profiled_call(key, func, args, kwargs)
+        wrapper.ncalls = 0
+        wrapper.__fuse__ = _hooks(key, ['_wrapper.ncalls += 1'],
+                                  {'_wrapper': wrapper})
+        return wrapper
 
 
 # This is a function based implementation of the same wrapper
 def profiler(func):
-    ncalls = 0
+    key = _Key(func)
 
     @wraps(func)
     def wrapper(*args, **kwargs):
-        nonlocal ncalls
-        ncalls += 1
-        return func(*args, **kwargs)
-    wrapper.ncalls = lambda: ncalls
+        return _profiled_call(key, func, args, kwargs)
+    wrapper.ncalls = _ncalls(key)
+    wrapper.__fuse__ = _hooks(key)
     return wrapper
 
 
@@ -70,3 +256,59 @@ class Spam:
 
 # add.ncalls should output the number of times the add
 # function is called
+
+
+class TestProfiled(unittest.TestCase):
+
+    def test_closures_with_the_same_qualname_count_apart(self):
+        for decorator, ncalls in ((Profiled, lambda f: f.ncalls),
+                                  (profiler, lambda f: f.ncalls())):
+            def make():
+                @decorator
+                def f():
+                    return 1
+                return f
+            first, second = make(), make()
+            first()
+            first()
+            second()
+            self.assertEqual((ncalls(first), ncalls(second)), (2, 1))
+
+    def test_method_is_a_plain_function(self):
+        class Counter:
+            @Profiled
+            def bump(self, n):
+                return n + 1
+
+        self.assertIs(type(Counter.__dict__['bump']), types.FunctionType)
+        self.assertEqual(Counter().bump(1), 2)
+        self.assertEqual(Counter.bump.ncalls, 1)
+
+
+if __name__ == '__main__':
+    @profiler
+    def power(a, n):
+        return 1 if n == 0 else multiply(a, power(a, n - 1))
+
+    def work():
+        for i in range(1000):
+            add(i, power(2, 5))
+
+    threads = [threading.Thread(target=work) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    print(add.ncalls, multiply.ncalls())
+    # >> 4000 20000
+    for name, row in sorted(stats().items()):
+        print(name, row)
+    print(call_graph())
+    print(folded_stacks().splitlines()[:3])
+    # >> ['__main__.add 1234567', '__main__.power 2345678', ...]
+
+    spam = Spam()
+    spam.bar(1)
+    print(Spam.bar.ncalls)
+    # >> 1
+    unittest.main()
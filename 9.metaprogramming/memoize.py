@@ -0,0 +1,252 @@
+from collections import OrderedDict, namedtuple
+from functools import wraps
+import threading
+import time
+import unittest
+
+"""
+@memoize(maxsize=1024, ttl=60)
+def load(key, *, fresh=False):
+    pass
+
+Results are kept per argument list, keyword arguments included, in an
+OrderedDict used as an LRU: a hit moves the entry to the end, and when
+the cache holds more than maxsize entries the first one is evicted. With
+ttl an entry also expires that many seconds after it was stored.
+
+When several threads ask for the same missing key at once only the
+first calls the function, the others wait for its result (single
+flight). Exceptions are passed to all of them and are not cached. A
+call that reaches the same key again from inside the computation (on
+the thread computing it) raises RuntimeError instead of waiting for
+itself forever.
+"""
+
+CacheInfo = namedtuple('CacheInfo', 'hits misses evictions maxsize currsize')
+
+# Separates the positional arguments from the keyword ones in a key, so
+# f(1, ('b', 2)) and f(1, b=2) don't collide
+_KWD_MARK = object()
+
+
+def make_key(args, kwargs):
+    if not kwargs:
+        return args
+    return args + (_KWD_MARK,) + tuple(sorted(kwargs.items()))
+
+
+class _Call:
+    """A computation in progress that other threads can wait for"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.owner = threading.get_ident()
+        self.result = None
+        self.error = None
+
+
+def memoize(func=None, *, maxsize=128, ttl=None, timer=time.monotonic):
+    """
+    Cache the results of func. maxsize=None means unbounded, ttl is in
+    seconds (None: entries never expire)
+    """
+    if func is None:
+        return lambda func: memoize(func, maxsize=maxsize, ttl=ttl,
+                                    timer=timer)
+
+    cache = OrderedDict()          # key -> (result, expiry time or None)
+    calls = {}                     # key -> _Call in progress
+    lock = threading.Lock()
+    hits = misses = evictions = 0
+
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        nonlocal hits, misses, evictions
+        key = make_key(args, kwargs)
+        with lock:
+            entry = cache.get(key)
+            if entry is not None:
+                result, expires = entry
+                if expires is None or timer() < expires:
+                    hits += 1
+                    cache.move_to_end(key)
+                    return result
+                del cache[key]
+            call = calls.get(key)
+            if call is None:
+                misses += 1
+                call = calls[key] = _Call()
+                owner = True
+            elif call.owner == threading.get_ident():
+                raise RuntimeError('{} called itself with the same arguments '
+                                   'while computing them'.format(
+                                       func.__qualname__))
+            else:
+                hits += 1
+                owner = False
+
+        if not owner:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        try:
+            call.result = func(*args, **kwargs)
+        except BaseException as e:
+            call.error = e
+            raise
+        else:
+            with lock:
+                expires = None if ttl is None else timer() + ttl
+                cache[key] = (call.result, expires)
+                if maxsize is not None and len(cache) > maxsize:
+                    cache.popitem(last=False)
+                    evictions += 1
+            return call.result
+        finally:
+            with lock:
+                del calls[key]
+            call.done.set()
+
+    def cache_info():
+        with lock:
+            return CacheInfo(hits, misses, evictions, maxsize, len(cache))
+
+    def cache_clear():
+        nonlocal hits, misses, evictions
+        with lock:
+            cache.clear()
+            hits = misses = evictions = 0
+
+    wrapper.cache_info = cache_info
+    wrapper.cache_clear = cache_clear
+    return wrapper
+
+
+class TestMemoize(unittest.TestCase):
+
+    def test_falsy_results_are_cached(self):
+        calls = []
+
+        @memoize
+        def zero(x):
+            calls.append(x)
+            return 0
+
+        self.assertEqual(zero(1), 0)
+        self.assertEqual(zero(1), 0)
+        self.assertEqual(calls, [1])
+        self.assertEqual(zero.cache_info().hits, 1)
+
+    def test_keyword_arguments_are_part_of_the_key(self):
+        @memoize
+        def power(x, exponent=2):
+            return x ** exponent
+
+        self.assertEqual(power(3), 9)
+        self.assertEqual(power(3, exponent=3), 27)
+        self.assertEqual(power(exponent=3, x=3), 27)
+        self.assertEqual(power.cache_info().misses, 3)
+        self.assertEqual(power(x=3, exponent=3), 27)
+        self.assertEqual(power.cache_info().hits, 1)
+
+    def test_lru_eviction(self):
+        @memoize(maxsize=2)
+        def double(x):
+            return 2 * x
+
+        double(1)
+        double(2)
+        double(1)
+        double(3)   # evicts 2, the least recently used
+        info = double.cache_info()
+        self.assertEqual((info.evictions, info.currsize), (1, 2))
+        double(1)
+        self.assertEqual(double.cache_info().hits, 2)
+        double(2)
+        self.assertEqual(double.cache_info().misses, 4)
+
+    def test_ttl(self):
+        now = [0.0]
+
+        @memoize(ttl=10, timer=lambda: now[0])
+        def stamp(x):
+            return now[0]
+
+        self.assertEqual(stamp(1), 0.0)
+        now[0] = 9.0
+        self.assertEqual(stamp(1), 0.0)
+        now[0] = 10.0
+        self.assertEqual(stamp(1), 10.0)
+
+    def test_single_flight(self):
+        started = threading.Event()
+        release = threading.Event()
+        calls = []
+
+        @memoize
+        def slow(x):
+            calls.append(x)
+            started.set()
+            release.wait(10)
+            return x * 10
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(slow(4)))
+                   for _ in range(5)]
+        threads[0].start()
+        self.assertTrue(started.wait(10))
+        for t in threads[1:]:
+            t.start()
+        # The first computation is held until the four other threads are
+        # waiting for it: a waiter is counted as a hit before it waits,
+        # and nothing is in the cache yet for a plain hit
+        deadline = time.monotonic() + 10
+        while slow.cache_info().hits < 4 and time.monotonic() < deadline:
+            time.sleep(0.001)
+        self.assertEqual(slow.cache_info().hits, 4)
+        release.set()
+        for t in threads:
+            t.join()
+        self.assertEqual(results, [40] * 5)
+        self.assertEqual(calls, [4])
+        self.assertEqual(slow.cache_info().misses, 1)
+
+    def test_recursion_on_the_same_key_raises(self):
+        @memoize
+        def loop(x):
+            return loop(x)
+
+        @memoize
+        def fib(n):
+            return n if n < 2 else fib(n - 1) + fib(n - 2)
+
+        self.assertRaises(RuntimeError, loop, 1)
+        self.assertEqual(fib(30), 832040)
+
+    def test_exceptions_are_not_cached(self):
+        calls = []
+
+        @memoize
+        def fail(x):
+            calls.append(x)
+            raise ValueError(x)
+
+        self.assertRaises(ValueError, fail, 1)
+        self.assertRaises(ValueError, fail, 1)
+        self.assertEqual(calls, [1, 1])
+        self.assertEqual(fail.cache_info().currsize, 0)
+
+    def test_cache_clear(self):
+        @memoize
+        def identity(x):
+            return x
+
+        identity(1)
+        identity.cache_clear()
+        self.assertEqual(identity.cache_info(), CacheInfo(0, 0, 0, 128, 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,17 +1,104 @@
+import asyncio
+import os
+import threading
+import time
+import unittest
 import weakref
+from collections import OrderedDict, namedtuple
+from inspect import signature
+
+from codegen import defaults, make_function, signature_source
+
+
+# The first version tested `if self.__instance:` without a lock: two
+# threads could both build an instance, and an instance that is falsy
+# (say with __len__ returning 0) was rebuilt on every call. Now a
+# sentinel marks "not built yet" and the first call builds the instance
+# under a lock, checking again once it holds it. Every later call is an
+# attribute read and an `is` test.
+#
+# class Config(metaclass=Singleton, scope='thread') keeps one instance
+# per thread, scope='loop' one per running asyncio event loop.
+#
+# A forked child starts without the parent's instances (which may hold
+# sockets or open files), unless the class says fork_reset=False.
+_UNSET = object()
+_singletons = weakref.WeakSet()
+SCOPES = ('process', 'thread', 'loop')
 
 
 class Singleton(type):
-    def __init__(self, *args, **kwargs):
-        self.__instance = None
-        super().__init__(*args, **kwargs)
+    def __new__(mcls, name, bases, namespace, scope='process',
+                fork_reset=True, **kwargs):
+        return super().__new__(mcls, name, bases, namespace, **kwargs)
+
+    def __init__(self, name, bases, namespace, scope='process',
+                 fork_reset=True, **kwargs):
+        if scope not in SCOPES:
+            raise ValueError('scope must be one of {}'.format(', '.join(SCOPES)))
+        super().__init__(name, bases, namespace, **kwargs)
+        self._singleton_scope = scope
+        self._singleton_fork_reset = fork_reset
+        self.reset_instance()
+        _singletons.add(self)
+
+    def reset_instance(self):
+        """Forget the instance(s), the next call builds a new one"""
+        self.__instance = _UNSET
+        # a lock held by another thread at fork time stays held in the
+        # child, so a reset always makes a new one
+        self._singleton_lock = threading.RLock()
+        self._singleton_local = threading.local()
+        self._singleton_loops = weakref.WeakKeyDictionary()
+        self._singleton_last = (lambda: None, _UNSET)
 
     def __call__(self, *args, **kwargs):
-        if self.__instance:
-            return self.__instance
-        else:
-            self.__instance = super().__call__(*args, **kwargs)
-            return self.__instance
+        instance = self.__instance
+        if instance is not _UNSET:
+            return instance
+        if self._singleton_scope == 'thread':
+            return self._thread_instance(args, kwargs)
+        if self._singleton_scope == 'loop':
+            return self._loop_instance(args, kwargs)
+        with self._singleton_lock:
+            instance = self.__instance
+            if instance is _UNSET:
+                instance = super().__call__(*args, **kwargs)
+                self.__instance = instance
+            return instance
+
+    def _thread_instance(self, args, kwargs):
+        local = self._singleton_local
+        try:
+            return local.instance
+        except AttributeError:
+            local.instance = super().__call__(*args, **kwargs)
+            return local.instance
+
+    def _loop_instance(self, args, kwargs):
+        loop = asyncio.get_running_loop()
+        # (weak reference to the loop, instance) of the last loop seen,
+        # which saves the WeakKeyDictionary lookup in the common case
+        last_loop, instance = self._singleton_last
+        if last_loop() is loop:
+            return instance
+        with self._singleton_lock:
+            instance = self._singleton_loops.get(loop, _UNSET)
+            if instance is _UNSET:
+                instance = super().__call__(*args, **kwargs)
+                self._singleton_loops[loop] = instance
+            self._singleton_last = (weakref.ref(loop), instance)
+            return instance
+
+
+def _reset_after_fork():
+    for cls in list(_singletons):
+        if cls._singleton_fork_reset:
+            cls.reset_instance()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
 
 
 class Person(metaclass=Singleton):
@@ -20,19 +107,133 @@ class Person(metaclass=Singleton):
 
 
 # Second example of caching instances using metaclass
+# The cache key used to be the positional args, so Student(name='Aman')
+# missed Student('Aman'), and two threads could both miss and build two
+# instances. Now:
+# - the key is made by a function generated with the parameters of
+#   __init__, which returns the arguments with the defaults filled in,
+#   so every way of passing the same values gives the same key
+# - a miss is checked again and the instance built under a per-class
+#   lock; a hit only reads the weak map
+# - arguments that don't fit raise the TypeError of a bind against the
+#   signature of __init__, which names it rather than the key function
+# - an __init__ with a parameter named like one of the generated
+#   function's globals (_tuple, _d_credits, ...) gets a key function that
+#   binds the arguments to the signature instead, slower but the same key
+# - class Student(metaclass=Cached, cache_size=100) also keeps the 100
+#   most recently used instances alive, in an LRU in front of the weak
+#   map, so they survive while nobody else holds them. A hit moves its
+#   entry to the end without the lock (OrderedDict.move_to_end is one
+#   C call under the GIL), only an insert or an eviction takes it
+CacheInfo = namedtuple('CacheInfo', 'hits misses evictions currsize strongsize')
+
+
+def _key_function(cls):
+    sig = signature(cls.__init__)
+    sig = sig.replace(parameters=list(sig.parameters.values())[1:])
+    params, _ = signature_source(sig)
+    key = []
+    for name, param in sig.parameters.items():
+        if param.kind is param.VAR_KEYWORD:
+            key.append('_tuple(_sorted({}.items()))'.format(name))
+        else:
+            key.append(name)
+    namespace = {'_tuple': tuple, '_sorted': sorted}
+    namespace.update(defaults(sig))
+    body = ['return ({},)'.format(', '.join(key)) if key else 'return ()']
+    try:
+        return make_function('key', params, body, namespace,
+                             '<Cached key for {}>'.format(cls.__qualname__))
+    except ValueError:
+        # a parameter would hide one of the names above
+        return _bound_key_function(sig)
+
+
+def _bound_key_function(sig):
+    """The key function made by _key_function, with Signature.bind"""
+    var_keyword = [name for name, param in sig.parameters.items()
+                   if param.kind is param.VAR_KEYWORD]
+
+    def key(*args, **kwargs):
+        bound = sig.bind(*args, **kwargs)
+        bound.apply_defaults()
+        arguments = bound.arguments
+        for name in var_keyword:
+            arguments[name] = tuple(sorted(arguments[name].items()))
+        return tuple(arguments.values())
+    return key
+
 
 class Cached(type):
-    def __init__(self, *args, **kwargs):
+    def __new__(mcls, name, bases, namespace, cache_size=0, **kwargs):
+        return super().__new__(mcls, name, bases, namespace, **kwargs)
+
+    def __init__(self, name, bases, namespace, cache_size=0, **kwargs):
+        super().__init__(name, bases, namespace, **kwargs)
         self.arg_to_instance_dict = weakref.WeakValueDictionary()
-        super().__init__(*args, **kwargs)
+        self._cache_size = cache_size
+        self._recent = OrderedDict()
+        # reentrant: an __init__ may create another instance of the class
+        self._cache_lock = threading.RLock()
+        self._cache_key = _key_function(self)
+        self._init_signature = signature(self.__init__)
+        self._hits = self._misses = self._evictions = 0
 
     def __call__(self, *args, **kwargs):
-        if args in self.arg_to_instance_dict:
-            return self.arg_to_instance_dict[args]
-        else:
-            obj = super().__call__(*args, **kwargs)
-            self.arg_to_instance_dict[args] = obj
+        try:
+            key = self._cache_key(*args, **kwargs)
+        except TypeError:
+            self._bind_error(args, kwargs)
+            raise
+        obj = self.arg_to_instance_dict.get(key)
+        if obj is not None:
+            self._hits += 1
+            if self._cache_size:
+                self._remember(key, obj)
             return obj
+        with self._cache_lock:
+            obj = self.arg_to_instance_dict.get(key)
+            if obj is not None:
+                self._hits += 1
+            else:
+                self._misses += 1
+                obj = super().__call__(*args, **kwargs)
+                self.arg_to_instance_dict[key] = obj
+            if self._cache_size:
+                self._remember(key, obj)
+        return obj
+
+    def _bind_error(self, args, kwargs):
+        """Raise the TypeError of calling __init__ with these arguments"""
+        try:
+            self._init_signature.bind(None, *args, **kwargs)
+        except TypeError as e:
+            raise TypeError('{}.__init__(): {}'.format(
+                self.__qualname__, e)) from None
+
+    def _remember(self, key, obj):
+        recent = self._recent
+        try:
+            recent.move_to_end(key)
+            return
+        except KeyError:
+            pass
+        with self._cache_lock:
+            recent[key] = obj
+            if len(recent) > self._cache_size:
+                recent.popitem(last=False)
+                self._evictions += 1
+
+    def cache_info(self):
+        with self._cache_lock:
+            return CacheInfo(self._hits, self._misses, self._evictions,
+                             len(self.arg_to_instance_dict), len(self._recent))
+
+    def cache_clear(self):
+        with self._cache_lock:
+            self.arg_to_instance_dict.clear()
+            self._recent.clear()
+            self._hits = self._misses = self._evictions = 0
 
 
 class Student(metaclass=Cached):
@@ -41,6 +242,129 @@ class Student(metaclass=Cached):
         self.name = name
 
 
+class Course(metaclass=Cached, cache_size=2):
+    def __init__(self, title, credits=3):
+        self.title = title
+        self.credits = credits
+
+
+def _construct_concurrently(make, nthreads=8):
+    """Call make() from nthreads threads at once, return the results"""
+    barrier = threading.Barrier(nthreads)
+    results = []
+
+    def run():
+        barrier.wait()
+        results.append(make())
+
+    threads = [threading.Thread(target=run) for _ in range(nthreads)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return results
+
+
+class TestCached(unittest.TestCase):
+
+    def test_one_instance_under_contention(self):
+        built = []
+
+        class Slow(metaclass=Cached):
+            def __init__(self, name):
+                built.append(name)
+                # long enough for every thread to miss the cache
+                time.sleep(0.05)
+
+        results = _construct_concurrently(lambda: Slow('x'))
+        self.assertEqual(built, ['x'])
+        self.assertEqual(len(set(map(id, results))), 1)
+        self.assertEqual(Slow.cache_info().misses, 1)
+
+    def test_parameters_named_like_generated_globals(self):
+        class Clash(metaclass=Cached):
+            def __init__(self, _tuple, b=2, _d_b=3, **_sorted):
+                self.args = (_tuple, b, _d_b, _sorted)
+
+        first = Clash(1, z=5)
+        self.assertIs(Clash(_tuple=1, b=2, z=5), first)
+        self.assertIsNot(Clash(1, 3, z=5), first)
+        self.assertEqual(first.args, (1, 2, 3, {'z': 5}))
+        with self.assertRaisesRegex(TypeError, r'Clash\.__init__\(\)'):
+            Clash()
+
+
+class TestSingleton(unittest.TestCase):
+
+    def test_one_instance_under_contention(self):
+        built = []
+
+        class Slow(metaclass=Singleton):
+            def __init__(self):
+                built.append(threading.get_ident())
+                time.sleep(0.05)
+
+        results = _construct_concurrently(Slow)
+        self.assertEqual(len(built), 1)
+        self.assertEqual(len(set(map(id, results))), 1)
+
+    def test_one_instance_per_thread(self):
+        class PerThread(metaclass=Singleton, scope='thread'):
+            pass
+
+        def twice():
+            first = PerThread()
+            self.assertIs(PerThread(), first)
+            return first
+
+        results = _construct_concurrently(twice)
+        self.assertEqual(len(set(map(id, results))), len(results))
+
+
+def benchmark(number=1000000):
+    import timeit
+
+    class OldSingleton(type):
+        # The unlocked version this module used to have
+        def __init__(self, *args, **kwargs):
+            self.__instance = None
+            super().__init__(*args, **kwargs)
+
+        def __call__(self, *args, **kwargs):
+            if self.__instance:
+                return self.__instance
+            self.__instance = super().__call__(*args, **kwargs)
+            return self.__instance
+
+    class Old(metaclass=OldSingleton):
+        pass
+
+    class Process(metaclass=Singleton):
+        pass
+
+    class PerThread(metaclass=Singleton, scope='thread'):
+        pass
+
+    class PerLoop(metaclass=Singleton, scope='loop'):
+        pass
+
+    module_global = Process()
+
+    def per_call(func):
+        func()
+        best = min(timeit.repeat(func, number=number, repeat=5))
+        return best / number * 1e9
+
+    print('{:>22}: {:.1f}ns'.format('module global',
+                                    per_call(lambda: module_global)))
+    for cls in (Old, Process, PerThread):
+        print('{:>22}: {:.1f}ns'.format(cls.__name__ + '()', per_call(cls)))
+
+    async def in_loop():
+        return per_call(PerLoop)
+    print('{:>22}: {:.1f}ns'.format('PerLoop()', asyncio.run(in_loop())))
+
+
 if __name__ == '__main__':
     p1 = Person('Aman')
     p1.name
@@ -67,3 +391,19 @@ if __name__ == '__main__':
 
     s2 is s1
     # Out[6]: False
+
+    s2 is s
+    # >> True
+    Student(name='Aman') is s
+    # >> True
+
+    Course('Maths')
+    Course('Physics', credits=4)
+    Course(title='Maths', credits=3)
+    # Physics, the least recently used, is dropped from the LRU
+    Course('Chemistry')
+    print(Course.cache_info())
+    # >> CacheInfo(hits=1, misses=3, evictions=1, currsize=2, strongsize=2)
+    print('-x-'*30)
+    benchmark()
+    unittest.main()
@@ -0,0 +1,243 @@
+import atexit
+import logging
+import os
+import queue
+import threading
+import time
+import traceback
+import unittest
+import weakref
+
+"""
+loggedv1 and loggedv2 used to call logger.log() on every call of the
+decorated function: a level check, a findCaller() stack walk, and the
+handlers' locks and I/O, all on the caller's thread.
+
+LogCall is what their wrappers call now:
+
+- whether the level is enabled is asked once, on the first call, and
+  kept until set_level() (or refresh()) is called, so a disabled
+  message costs an attribute test in the wrapper
+- an enabled message is turned into a LogRecord on the caller's thread
+  (time and thread name stay right) and put on a queue. A background
+  thread, the LogDispatcher, passes it to logger.handle(), which runs
+  the logger's filters and handlers as logger.log() would have
+- sample=N only logs every Nth call and rate=N at most N messages per
+  second; the calls left out are counted in `skipped`
+
+A forked child has no dispatcher thread, only the parent's Thread
+object. After a fork every dispatcher forgets it, and the records the
+parent had queued, so the child starts its own thread on its first
+record.
+
+The counters used for sampling and rate limiting are not locked, under
+contention they are approximate.
+"""
+
+_STOP = object()
+# every LogDispatcher, reset in a forked child
+_dispatchers = weakref.WeakSet()
+
+
+class LogDispatcher:
+    """Hands queued (logger, record) pairs to logger.handle() on a thread"""
+
+    def __init__(self):
+        self._reset()
+        _dispatchers.add(self)
+
+    def _reset(self):
+        self._queue = queue.SimpleQueue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(
+                    target=self._run, name='LogDispatcher', daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        get = self._queue.get
+        while True:
+            item = get()
+            if item is _STOP:
+                break
+            if isinstance(item, threading.Event):
+                item.set()
+                continue
+            logger, record = item
+            try:
+                logger.handle(record)
+            except Exception:
+                # Handlers report their own errors, this is a filter
+                # failing. Keep the thread alive for the other records
+                if logging.raiseExceptions:
+                    traceback.print_exc()
+
+    def put(self, logger, record):
+        if self._thread is None:
+            self.start()
+        self._queue.put((logger, record))
+
+    def flush(self, timeout=None):
+        """Wait until the records queued so far have been handled"""
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        self._queue.put(done)
+        return done.wait(timeout)
+
+    def stop(self):
+        """Handle what is queued and stop the thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(_STOP)
+            thread.join()
+
+
+def _after_fork_in_child():
+    # the parent's records are the parent's to handle, and its lock may
+    # have been held by a thread that does not exist here
+    for each in list(_dispatchers):
+        each._reset()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+
+dispatcher = LogDispatcher()
+atexit.register(dispatcher.stop)
+
+
+class LogCall:
+    """Logs message on logger at level, through the dispatcher"""
+
+    def __init__(self, logger, level, message, func=None, sample=1, rate=None,
+                 dispatcher=dispatcher):
+        self.logger = logger
+        self.level = level
+        self.message = message
+        self.sample = sample
+        self.rate = rate
+        self.dispatcher = dispatcher
+        # None until the first call asks the logger, then True or False
+        self.enabled = None
+        self.skipped = 0
+        self._calls = 0
+        self._window = 0.0
+        self._sent_in_window = 0
+        if func is not None:
+            code = getattr(func, '__code__', None)
+            self._where = (code.co_filename if code else '(unknown file)',
+                           code.co_firstlineno if code else 0, func.__name__)
+        else:
+            self._where = ('(unknown file)', 0, None)
+
+    def set_level(self, level):
+        self.level = level
+        self.enabled = None
+
+    def refresh(self):
+        """Ask the logger again, after the logging configuration changed"""
+        self.enabled = None
+
+    def __call__(self):
+        enabled = self.enabled
+        if enabled is None:
+            enabled = self.enabled = self.logger.isEnabledFor(self.level)
+        if not enabled:
+            return
+        if self.sample > 1:
+            self._calls += 1
+            if self._calls % self.sample:
+                self.skipped += 1
+                return
+        if self.rate is not None:
+            now = time.monotonic()
+            if now - self._window >= 1.0:
+                self._window = now
+                self._sent_in_window = 0
+            if self._sent_in_window >= self.rate:
+                self.skipped += 1
+                return
+            self._sent_in_window += 1
+        filename, lineno, funcname = self._where
+        logger = self.logger
+        record = logger.makeRecord(logger.name, self.level, filename, lineno,
+                                   self.message, (), None, funcname)
+        self.dispatcher.put(logger, record)
+
+
+class TestLogCall(unittest.TestCase):
+
+    def setUp(self):
+        self.records = []
+        self.logger = logging.getLogger('queued_logging.test')
+        self.logger.propagate = False
+        self.logger.setLevel(logging.DEBUG)
+        self.handler = logging.Handler()
+        self.handler.emit = self.records.append
+        self.logger.addHandler(self.handler)
+
+    def tearDown(self):
+        self.logger.removeHandler(self.handler)
+
+    def test_records_reach_the_handlers(self):
+        log = LogCall(self.logger, logging.INFO, 'hello', func=self.setUp)
+        log()
+        dispatcher.flush()
+        self.assertEqual([r.getMessage() for r in self.records], ['hello'])
+        self.assertEqual(self.records[0].funcName, 'setUp')
+        self.assertEqual(self.records[0].threadName,
+                         threading.current_thread().name)
+
+    def test_level_is_cached_until_set_level(self):
+        log = LogCall(self.logger, logging.DEBUG, 'debug')
+        self.logger.setLevel(logging.WARNING)
+        log()
+        self.assertIs(log.enabled, False)
+        log.set_level(logging.ERROR)
+        log()
+        dispatcher.flush()
+        self.assertEqual([r.levelno for r in self.records], [logging.ERROR])
+
+    def test_sampling_and_rate(self):
+        sampled = LogCall(self.logger, logging.INFO, 'sampled', sample=10)
+        limited = LogCall(self.logger, logging.INFO, 'limited', rate=5)
+        for _ in range(100):
+            sampled()
+            limited()
+        dispatcher.flush()
+        messages = [r.getMessage() for r in self.records]
+        self.assertEqual(messages.count('sampled'), 10)
+        self.assertEqual(messages.count('limited'), 5)
+        self.assertEqual((sampled.skipped, limited.skipped), (90, 95))
+
+    @unittest.skipUnless(hasattr(os, 'fork'), 'needs os.fork')
+    def test_child_starts_its_own_thread(self):
+        log = LogCall(self.logger, logging.INFO, 'from the child')
+        log()
+        dispatcher.flush()
+        read, write = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            try:
+                log()
+                handled = (dispatcher.flush(5) and
+                           self.records[-1].getMessage() == 'from the child'
+                           and len(self.records) == 2)
+                os.write(write, b'1' if handled else b'0')
+            finally:
+                os._exit(0)
+        os.close(write)
+        with os.fdopen(read, 'rb') as f:
+            result = f.read()
+        os.waitpid(pid, 0)
+        self.assertEqual(result, b'1')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,6 +2,9 @@ from functools import wraps
 import time
 import unittest
 
+from decorator_fusion import Hooks
+from timing_registry import registry
+
 """
 @deco
 def func(x, y):
@@ -16,12 +19,23 @@ deco = deco(func)
 
 def timeit(func):
     """ Simple decorator to record time of an operation """
+    # The duration goes in the latency histogram of timing_registry,
+    # printing it on every call was slow and flooded stdout
+    name = '{}.{}'.format(func.__module__, func.__qualname__)
+
     @wraps(func)
     def wrapper(*args, **kwargs):
-        start = time.time()
-        func(*args, **kwargs)
-        end = time.time()
-        print("Operation took {} seconds".format(end-start))
+        start = time.perf_counter_ns()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            registry.record(name, time.perf_counter_ns() - start)
+    wrapper.__fuse__ = Hooks(
+        before=['_start = _now()'],
+        after=['_record(_name, _now() - _start)'],
+        namespace={'_now': time.perf_counter_ns, '_record': registry.record,
+                   '_name': name},
+        locals=['_start'])
     return wrapper
 
 
@@ -52,6 +66,8 @@ class TestSimpleDecorator(unittest.TestCase):
         # decorator not invoked. Original function called"""
         countdown.__wrapped__(100000)
 
+        self.assertEqual(add(3, 4), 7)
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -0,0 +1,65 @@
+import itertools
+import threading
+import weakref
+
+"""
+The profilers record into per thread state so the hot path takes no
+lock: timing_registry.py keeps one histogram per function and thread,
+decorators_as_class.py a _ThreadStats, and 8.classes/instrumentation.py
+a list of counters.
+
+ThreadTotals keeps that state for one of them. get() returns the
+current thread's state, creating it with new() on the thread's first
+call. The states of the live threads are kept in `live` so a reader can
+merge them; when a thread exits, merge(retired, state) adds its state to
+`retired` and it is dropped from `live`, so a pool that keeps replacing
+threads does not grow it.
+
+A hot path can read `local.state` itself and call get() only on
+AttributeError, which saves a method call.
+"""
+
+
+class _ThreadSentinel:
+    """Lives in a thread's local as long as the thread, see ThreadTotals.get()"""
+
+
+class ThreadTotals:
+    def __init__(self, new, merge, retired=None):
+        self._new = new
+        self._merge = merge
+        self.lock = threading.Lock()
+        # thread key -> state of the live threads
+        self.live = {}
+        # the states of the threads that exited, merged
+        self.retired = new() if retired is None else retired
+        self.local = threading.local()
+        self._keys = itertools.count()
+
+    def get(self):
+        """Return the current thread's state"""
+        try:
+            return self.local.state
+        except AttributeError:
+            pass
+        key = next(self._keys)
+        state = self._new()
+        with self.lock:
+            self.live[key] = state
+        # The thread's threading.local values are released when it exits,
+        # with them the sentinel, and the finalizer retires the state
+        sentinel = self.local.sentinel = _ThreadSentinel()
+        weakref.finalize(sentinel, self._retire, key)
+        self.local.state = state
+        return state
+
+    def _retire(self, key):
+        with self.lock:
+            state = self.live.pop(key, None)
+            if state is not None:
+                self._merge(self.retired, state)
+
+    def states(self):
+        """Return the retired totals followed by the live threads' states"""
+        with self.lock:
+            return [self.retired] + list(self.live.values())
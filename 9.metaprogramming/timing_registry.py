@@ -0,0 +1,267 @@
+from functools import wraps
+import json
+import os
+import threading
+from time import perf_counter_ns
+import unittest
+
+from decorator_fusion import Hooks
+from thread_totals import ThreadTotals
+
+"""
+@timed
+def handle(request):
+    pass
+
+records how long every call of handle takes, in nanoseconds, into a
+latency histogram kept in a TimingRegistry (by default the module's
+`registry`). Nothing is printed; registry.snapshot() returns count,
+mean, p50, p95, p99 and max per function, report() formats it as a
+table and export() writes it as JSON.
+
+The histogram has log buckets: four per power of two, so a percentile
+is known to within 25% and a bucket index costs a bit_length() and a
+shift. Every thread records into its own histograms, no lock is taken
+per call. The registry keeps a reference to each and sums them when it
+is read; when a thread exits its histograms are added to shared totals
+and dropped, so a pool that keeps replacing threads does not grow it.
+"""
+
+_SUB_BUCKETS = 4                   # per power of two, must be a power of two
+_SUB_BITS = _SUB_BUCKETS.bit_length() - 1
+_BUCKETS = _SUB_BUCKETS * 64
+# A histogram is a list: the bucket counts followed by the total time
+# and the longest call
+_TOTAL = _BUCKETS
+_MAX = _BUCKETS + 1
+
+
+def bucket(ns):
+    """Return the index of the histogram bucket for ns"""
+    shift = ns.bit_length() - _SUB_BITS - 1
+    if shift <= 0:
+        return ns
+    return (shift << _SUB_BITS) + (ns >> shift)
+
+
+def bucket_bounds(index):
+    """Return the lowest and highest ns that fall in bucket index"""
+    shift = (index >> _SUB_BITS) - 1
+    if shift <= 0:
+        return index, index
+    base = index - (shift << _SUB_BITS)
+    return base << shift, ((base + 1) << shift) - 1
+
+
+def _merge(totals, histograms):
+    """Add the {name: histogram} of an exited thread to totals"""
+    for name, histogram in histograms.items():
+        total = totals.get(name)
+        if total is None:
+            totals[name] = list(histogram)
+            continue
+        for index in range(_MAX):
+            total[index] += histogram[index]
+        total[_MAX] = max(total[_MAX], histogram[_MAX])
+
+
+class TimingRegistry:
+    def __init__(self):
+        # {name: histogram} per thread, and summed over the exited ones
+        self._totals = ThreadTotals(dict, _merge)
+
+    def histogram(self, name):
+        """Return the current thread's histogram for name"""
+        histograms = self._totals.get()
+        histogram = histograms.get(name)
+        if histogram is None:
+            histogram = histograms[name] = [0] * (_BUCKETS + 2)
+        return histogram
+
+    def record(self, name, ns):
+        histogram = self.histogram(name)
+        histogram[bucket(ns)] += 1
+        histogram[_TOTAL] += ns
+        if ns > histogram[_MAX]:
+            histogram[_MAX] = ns
+
+    def timed(self, func=None, *, name=None):
+        """Decorator recording the duration of every call of func"""
+        if func is None:
+            return lambda func: self.timed(func, name=name)
+        if name is None:
+            name = '{}.{}'.format(func.__module__, func.__qualname__)
+        local = threading.local()
+        histogram_for = self.histogram
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = perf_counter_ns()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                ns = perf_counter_ns() - start
+                try:
+                    histogram = local.histogram
+                except AttributeError:
+                    histogram = local.histogram = histogram_for(name)
+                # bucket(ns), inlined
+                shift = ns.bit_length() - _SUB_BITS - 1
+                histogram[(shift << _SUB_BITS) + (ns >> shift)
+                          if shift > 0 else ns] += 1
+                histogram[_TOTAL] += ns
+                if ns > histogram[_MAX]:
+                    histogram[_MAX] = ns
+        # see decorator_fusion
+        wrapper.__fuse__ = Hooks(
+            before=['_start = _now()'],
+            after=['_record(_name, _now() - _start)'],
+            namespace={'_now': perf_counter_ns, '_record': self.record,
+                       '_name': name},
+            locals=['_start'])
+        return wrapper
+
+    def snapshot(self):
+        """
+        Return {name: {count, mean_ns, p50_ns, p95_ns, p99_ns, max_ns}}
+        over all threads. A percentile is the upper bound of its bucket
+        """
+        histograms = {}
+        for per_thread in self._totals.states():
+            for name, histogram in list(per_thread.items()):
+                histograms.setdefault(name, []).append(list(histogram))
+        result = {}
+        for name, per_thread in histograms.items():
+            merged = [sum(column) for column in zip(*per_thread)]
+            merged[_MAX] = max(h[_MAX] for h in per_thread)
+            counts = merged[:_BUCKETS]
+            count = sum(counts)
+            if not count:
+                continue
+            stats = {'count': count, 'mean_ns': merged[_TOTAL] / count}
+            for label, q in (('p50_ns', 0.50), ('p95_ns', 0.95),
+                             ('p99_ns', 0.99)):
+                stats[label] = min(self._percentile(counts, count, q),
+                                   merged[_MAX])
+            stats['max_ns'] = merged[_MAX]
+            result[name] = stats
+        return result
+
+    @staticmethod
+    def _percentile(counts, count, q):
+        rank = q * count
+        seen = 0
+        for index, n in enumerate(counts):
+            seen += n
+            if n and seen >= rank:
+                return bucket_bounds(index)[1]
+        return 0
+
+    def reset(self):
+        totals = self._totals
+        with totals.lock:
+            totals.retired.clear()
+            for per_thread in totals.live.values():
+                for histogram in per_thread.values():
+                    histogram[:] = [0] * len(histogram)
+
+    def report(self):
+        lines = ['{:<48} {:>9} {:>11} {:>11} {:>11} {:>11} {:>11}'.format(
+            'function', 'count', 'mean ns', 'p50 ns', 'p95 ns', 'p99 ns',
+            'max ns')]
+        for name, stats in sorted(self.snapshot().items()):
+            lines.append('{:<48} {count:>9} {mean_ns:>11.0f} {p50_ns:>11} '
+                         '{p95_ns:>11} {p99_ns:>11} {max_ns:>11}'.format(
+                             name, **stats))
+        return '\n'.join(lines)
+
+    def export(self, path=None):
+        """Return the snapshot as JSON, and write it to path if given"""
+        text = json.dumps(self.snapshot(), indent=1, sort_keys=True)
+        if path is not None:
+            with open(path, 'w') as f:
+                f.write(text)
+        return text
+
+
+registry = TimingRegistry()
+timed = registry.timed
+
+
+def benchmark(number=200000):
+    import time
+    import timeit
+
+    def add(a, b):
+        return a + b
+
+    def print_per_call(func):
+        # What timeit and timethis did before
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.time()
+            rv = func(*args, **kwargs)
+            print("Operation took %s seconds" % (time.time() - start),
+                  file=devnull)
+            return rv
+        return wrapper
+
+    local_registry = TimingRegistry()
+    with open(os.devnull, 'w') as devnull:
+        for label, func in (('undecorated', add),
+                            ('time.time + print', print_per_call(add)),
+                            ('timed', local_registry.timed(add))):
+            best = min(timeit.repeat(lambda: func(1, 2), number=number,
+                                     repeat=5))
+            print('{:>20}: {:.1f}ns per call'.format(
+                label, best / number * 1e9))
+    print(local_registry.report())
+
+
+class TestTimingRegistry(unittest.TestCase):
+
+    def test_buckets_cover_every_value(self):
+        for ns in list(range(5000)) + [10**6, 10**9 + 7, 2**40 - 1]:
+            low, high = bucket_bounds(bucket(ns))
+            self.assertTrue(low <= ns <= high, ns)
+            self.assertLessEqual(high - low, max(1, low // 4))
+
+    def test_percentiles(self):
+        timings = TimingRegistry()
+        for ns in range(1, 1001):
+            timings.record('f', ns * 1000)
+        stats = timings.snapshot()['f']
+        self.assertEqual(stats['count'], 1000)
+        self.assertEqual(stats['max_ns'], 10**6)
+        for label, exact in (('p50_ns', 500000), ('p95_ns', 950000),
+                             ('p99_ns', 990000)):
+            self.assertGreaterEqual(stats[label], exact)
+            self.assertLessEqual(stats[label], exact * 1.25)
+
+    def test_threads_are_merged(self):
+        timings = TimingRegistry()
+
+        @timings.timed(name='work')
+        def work():
+            return 42
+
+        def run():
+            for _ in range(1000):
+                self.assertEqual(work(), 42)
+
+        threads = [threading.Thread(target=run) for _ in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(timings.snapshot()['work']['count'], 4000)
+        # the threads exited, their histograms were folded into retired
+        self.assertEqual(timings._totals.live, {})
+        self.assertEqual(list(timings._totals.retired), ['work'])
+        timings.reset()
+        self.assertEqual(timings.snapshot(), {})
+
+
+if __name__ == '__main__':
+    benchmark()
+    unittest.main()